@@ -0,0 +1,28 @@
+# EGM722 UK population analysis package: load the population data once and query it by year, county/UA and country.
+#
+# Names are imported from their modules on first use, so "import egm722" (and the command line, python -m egm722)
+# does not pay for pandas, geopandas, cartopy or matplotlib until a command needs them.
+
+import importlib
+
+_EXPORTS = {'PopulationCube': 'egm722.cube',
+            'country_assignment': 'egm722.cube',
+            'year_columns': 'egm722.cube',
+            'build_country_lookup': 'egm722.lookup',
+            'load_country_lookup': 'egm722.lookup',
+            'batch_statistics': 'egm722.stats',
+            'select_statistics': 'egm722.stats'}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(_EXPORTS[name]), name)
+        globals()[name] = value  # later lookups skip __getattr__
+        return value
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
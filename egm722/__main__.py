@@ -0,0 +1,7 @@
+# python -m egm722 <command>, see egm722/cli.py
+
+import sys
+
+from egm722.cli import main
+
+sys.exit(main())
@@ -0,0 +1,182 @@
+# Analysis functions of the EGM722 assignment script: summary statistics and tables for a selected year, county/unitary
+# authority, country and population change, answered from the population cube. Results are printed, and tables added
+# to an OutputBatch if one is given.
+
+from egm722.cube import COUNTIES_UA_ID, COUNTIES_UA_NAME
+from egm722.profiling import profiled
+
+
+def _cube_rows(result, cube, *args, **kwargs):
+    """ Rows processed by an analysis function, the counties/UA of the cube. """
+    return len(cube)
+
+
+def years_check(select_year, select_year1, data_year_start, data_year_end):
+    """ Check selected years are correct, select_year1>select_year for population difference calculation
+
+    :param select_year:  (str) input year within dataset to start calculation
+    :param select_year1: (str) input year within dataset to end calculation
+    :param data_year_start: (int) enter first year of the dataframe
+    :param data_year_end: (int) enter last year of the dataframe
+
+    :return: Compares select_year to select_year1 and returns a statement if years selected are suitable to continue.
+    """
+    select_year = int(select_year)
+    if select_year < data_year_start:
+        print('{} is outside the data range for years. Please provide a new year.'.format(select_year))
+    elif select_year1 > data_year_end:
+        print('{} is outside the data range for years. Please provide a new year.'.format(select_year1))
+    elif select_year > select_year1:
+        print ('{} is incorrect, please provide start year before ({}).'.format(select_year, select_year1))
+    elif select_year < select_year1:
+        print('The selected dates are suitable to continue.')
+    elif select_year == select_year1:
+        print('The selected years are the same, no difference will be displayed in the figure')
+
+
+@profiled(rows=_cube_rows)
+def year_population(cube, select_year, counties_UA_id=COUNTIES_UA_ID, counties_UA_name=COUNTIES_UA_NAME,
+                    outputs=None):
+    """ Generates summary population statistics for a given year between 1991 and 2019.
+
+    For a given year calculates the minimum and maximum county population, the mean population
+    across all the counties and the total population for the UK in the given year. Results
+    summarised in text statements.
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param select_year: (str) input year within dataset to map
+    :param counties_UA_id: (str) column containing counties/unitary authority unique ID
+    :param counties_UA_name: (str) column containing counties/unitary authority name
+    :param outputs: (OutputBatch) output tables of the run, None to only print the results
+
+    :return: Returns summary statistics (mean, min, ax and total) population statistcs for given year and creates a
+             .csv file of the results. An example, using 2002 as select_year, generates:
+
+             The mean county/unitary authorities population in the year 2002 was 274,841.10.
+             The largest county/unitary authorities population in the year 2002 was 1,338,968.
+             The smallest county/unitary authorities population in the year 2002 was 2,170.
+             The UK population/unitary authorities in the year 2002 was 59,365,677.
+    """
+    select_year = str(select_year)
+    stats = cube.year_statistics(select_year) # single column slice of the cube for the selected year
+    print('The mean county/unitary authorities population in the year ' + str(select_year) + ' was {:,.2f}.'.format(stats['mean']))
+    print('The largest county/unitary authorities population in the year ' + str(select_year) + ' was {:,.0f}.'.format(stats['max']))
+    print('The smallest county/unitary authorities population in the year ' + str(select_year) + ' was {:,.0f}.'.format(stats['min']))
+    print('The UK population/unitary authorities in the year ' + str(select_year) + ' was {:,.0f}.'.format(stats['sum']))
+    counties_UA_pop_order = cube.to_frame(years=[select_year])[[counties_UA_name, counties_UA_id, select_year]]
+        # selects the county/UA name and ID column and population data for selected year
+    print(counties_UA_pop_order.sort_values([select_year], ascending=[False])) # rearranges given year data into
+        # descending order (highest to lowest populated counties/UA.
+    if outputs is not None:
+        outputs.add(counties_UA_pop_order.sort_values([select_year], ascending=[False]),
+                    f'{counties_UA_id}_{select_year}')
+
+
+@profiled(rows=_cube_rows)
+def counties_UA_population_data(cube, select_county_UA, outputs=None):
+    """ Selects population data for a given county.
+
+    Fetches the population row data for a given county/UA from the population cube
+    and creates a .csv file of the data
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param select_county_UA: (str) input county/unitary authority name.
+    :param outputs: (OutputBatch) output tables of the run, None to only print the results
+
+    :return: A table, and .csv file, of the population data for every year for the selected county/UA.
+    """
+    counties_UA_population_data = cube.to_frame(rows=[cube.county_position(select_county_UA)])
+        # selects the user selected county/UA row from the population cube.
+    if outputs is not None:
+        outputs.add(counties_UA_population_data, f'counties_UA_name_{select_county_UA}')
+    print(counties_UA_population_data)
+
+
+@profiled(rows=_cube_rows)
+def country_data(cube, outputs=None):
+    """ Writes the population table of every county/unitary authority with the country it lies in.
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param outputs: (OutputBatch) output tables of the run, None to only print the results
+
+    :return: Creates a .csv file of counties/unitary authority, their country and population for every year.
+    """
+    country_population = cube.to_frame()
+    if outputs is not None:
+        outputs.add(country_population, 'country_population_all')
+
+
+@profiled(rows=_cube_rows)
+def country_year_population(cube, select_country, select_year, outputs=None):
+    """ Generates a table and .csv file for selected countries yearly population for the dataset
+
+    Fetches the population data for a given county from the population cube
+    and creates a .csv file of the country data including individual counties/UA.
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param select_country: (str) input country name
+    :param select_year: (str) input year within dataset to map
+    :param outputs: (OutputBatch) output tables of the run, None to only print the results
+
+    :return: Creates a summary statement for the countries population for selected year and a .csv file of the countries
+             population data for all year. An example of the statement:
+
+             Total population of England in 2006 was 50,965,186.
+    """
+    select_country = select_country.title()
+    select_year = str(select_year)
+    country = cube.to_frame(rows=cube.country_rows_of(select_country))
+    country_year = cube.country_year(select_country, select_year) # precomputed country total, no table scan
+    print('Total population of ' + str(select_country) + ' in ' + str(select_year) + ' was {:,.0f}.'.format(country_year))
+    if outputs is not None:
+        outputs.add(country, f'country_{select_country}_population')
+
+
+@profiled(rows=_cube_rows)
+def country_all_year(cube, select_year, outputs=None):
+    """ Prints a list of UK countries population for selected year, in descending order.
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param select_year: (str) input year within dataset to analyse.
+    :param outputs: (OutputBatch) output tables of the run, None to only print the results
+
+    :return: Returns a list of countries total population in descending order for selected yea. An example of the
+             output:
+
+            The below table list counties in descending population order for the year 2006.
+            CTRY20NM
+            England             50965186
+            Scotland             5133000
+            Wales                2985668
+            Northern Ireland     1743113
+    """
+    select_year = str(select_year)
+    sum_country_total = cube.country_all_year(select_year)
+    print('The table below list the countries in order of descending population for the year ' + (select_year) + '.')
+    print(sum_country_total.sort_values(ascending=False))
+    if outputs is not None:
+        outputs.add(sum_country_total.sort_values(ascending=False).reset_index(), f'country_totals_{select_year}')
+    return sum_country_total
+
+
+@profiled(rows=_cube_rows)
+def counties_UA_population_change(cube, select_year, select_year1, outputs=None):
+    """ Calculates the population difference between selected years.
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param select_year: (str) input year within dataset to analyse.
+    :param select_year1: (str) input later year within dataset to perform calculation.
+    :param outputs: (OutputBatch) output tables of the run, None to only print the results
+
+    :return: Returns the population change (positive or negative int) of every county/UA, in the row order of the cube,
+             which is used in figure to represent population change over selected timeframe. Table is printed in
+             descending population difference.
+    """
+    population_change = cube.change(select_year, select_year1)
+    change_table = cube.to_frame(years=[select_year, select_year1])
+    change_table['Population change'] = population_change
+    change_table = change_table.sort_values(['Population change'], ascending=[False])
+    print(change_table)
+    if outputs is not None:
+        outputs.add(change_table, f'population_change_{select_year}_{select_year1}')
+    return population_change
@@ -0,0 +1,326 @@
+# Benchmarks of the analysis at larger scales: synthetic datasets 10x, 100x and 1000x the size of the training data
+# (random county/UA-like polygons over the UK in OSGB and a population table with matching IDs and year columns) are
+# run through each stage of the analysis, recording the time and memory of each stage to a .json file so runs can be
+# compared, e.g. before moving to ward or LSOA level data.
+#
+#   python -m egm722.benchmark --scales 10,100 --output benchmarks/before.json
+#   python -m egm722.benchmark --scales 10,100 --compare benchmarks/before.json
+#
+# Stages, in the order they run:
+#   load   - read the population .csv and parse the counties/UA and country shapefiles (no geometry cache)
+#   join   - county/UA -> country lookup, build_country_lookup() (spatial joins)
+#   merge  - population cube and its merge with the counties/UA polygons, counties_UA_population_frame()
+#   stats  - summary statistics of every year, batch_statistics() and trend_summary()
+#   export - the script's output tables written with an OutputBatch
+#   render - a year map and a pie-chart saved to .png
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+from egm722.cube import (COUNTIES_UA_ID, COUNTIES_UA_NAME, COUNTRIES_SHP, COUNTRY_ID, NO_DATA, POPULATION_CSV, REPO_DIR,
+                         PopulationCube, year_columns)
+from egm722.profiling import max_rss_mb
+
+STAGES = ('load', 'join', 'merge', 'stats', 'export', 'render')
+SCALES = (10, 100, 1000)
+VERTICES = 48  # vertices per synthetic polygon, the training data counties/UA have a median of 41
+
+
+def synthetic_paths(data_dir, scale, vertices=VERTICES, seed=722):
+    """ Population .csv and counties/UA shapefile paths of a synthetic dataset. """
+    stem = os.path.join(data_dir, 'synthetic_x{}_v{}_s{}'.format(scale, vertices, seed))
+    return stem + '.csv', stem + '.shp'
+
+
+def synthetic_data(scale, data_dir, vertices=VERTICES, seed=722, nodata=0.001, population_csv=POPULATION_CSV,
+                   countries_shp=COUNTRIES_SHP):
+    """ Writes a synthetic population table and counties/UA shapefile scale times the size of the training data.
+
+    Polygons are jittered circles centred on random points inside the UK countries, sized so that together they
+    cover about the area of the UK. Population rows are training data rows picked at random, multiplied by random
+    factors and divided by scale so the UK total stays about the same, with a fraction of nodata ('-') values.
+
+    :param scale: (int) number of rows as a multiple of the training data
+    :param data_dir: (str) folder to write to, an existing dataset of the same scale, vertices and seed is reused
+    :param vertices: (int) vertices per polygon
+    :param seed: (int) random seed, the same seed gives the same dataset
+    :param nodata: (float) fraction of population values written as nodata
+    :param population_csv: (str) training population table the population rows are picked from
+    :param countries_shp: (str) country shapefile the polygons are placed in
+
+    :return: tuple of the (population .csv, counties/UA .shp) paths.
+    """
+    import geopandas as gpd
+    from shapely.geometry import Polygon
+    from egm722.geometry import OSGB_EPSG, load_geometry
+    from egm722.lookup import points_within
+
+    csv_path, shp_path = synthetic_paths(data_dir, scale, vertices, seed)
+    if os.path.exists(csv_path) and os.path.exists(shp_path):
+        return csv_path, shp_path
+    os.makedirs(data_dir, exist_ok=True)
+    rng = np.random.default_rng([seed, scale])
+    source = pd.read_csv(population_csv, na_values=NO_DATA)
+    years = year_columns(source)
+    n = len(source) * scale
+
+    countries = load_geometry(countries_shp)
+    xmin, ymin, xmax, ymax = countries.total_bounds
+    centres = np.empty((0, 2))
+    while len(centres) < n:  # keep the random points that fall inside a country
+        candidates = rng.uniform([xmin, ymin], [xmax, ymax], size=(2 * n, 2))
+        inside = points_within(gpd.GeoSeries(gpd.points_from_xy(candidates[:, 0], candidates[:, 1])),
+                               np.arange(len(candidates)), countries, COUNTRY_ID).index
+        centres = np.concatenate([centres, candidates[np.sort(inside)]])
+    centres = centres[:n]
+
+    radius = np.sqrt(countries.area.sum() / n / np.pi)
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    radii = radius * rng.uniform(0.6, 1.0, size=(n, vertices))
+    x = centres[:, :1] + radii * np.cos(angles)
+    y = centres[:, 1:] + radii * np.sin(angles)
+    ids = np.array(['S{:08d}'.format(i) for i in range(n)])
+    names = np.array(['Synthetic area {}'.format(i) for i in range(n)])
+    counties_UA = gpd.GeoDataFrame({COUNTIES_UA_ID: ids, 'CTYUA20NM': names},
+                                   geometry=[Polygon(np.column_stack([x[i], y[i]])) for i in range(n)],
+                                   crs='EPSG:{}'.format(OSGB_EPSG))
+    counties_UA.to_file(shp_path)
+
+    rows = source[years].to_numpy(dtype='float64')[rng.integers(0, len(source), n)]
+    values = np.rint(rows * rng.lognormal(0, 0.3, size=(n, 1)) / scale)
+    table = pd.DataFrame(values, columns=years).astype('Int64').astype(str)
+    table = table.mask((rng.random(table.shape) < nodata) | (table == '<NA>').to_numpy(), '-')
+    table.insert(0, COUNTIES_UA_ID, ids)
+    table.insert(0, COUNTIES_UA_NAME, names)
+    table.to_csv(csv_path, index=False)
+    return csv_path, shp_path
+
+
+def run_stages(population_csv, counties_UA_shp, countries_shp=COUNTRIES_SHP, output_dir=None, stages=STAGES,
+               dpi=100, trace_memory=False):
+    """ Runs the analysis stages on a dataset and measures each one.
+
+    A stage is always run if a later stage needs its results, but only the requested stages are reported.
+
+    :param population_csv: (str) population table
+    :param counties_UA_shp: (str) counties/unitary authority shapefile
+    :param countries_shp: (str) country shapefile
+    :param output_dir: (str) folder for the export and render outputs, a temporary folder if None
+    :param stages: (list) stages to report, from STAGES
+    :param dpi: (int) resolution of the rendered figures
+    :param trace_memory: (bool) also record the peak memory allocated within each stage with tracemalloc, which slows
+                         the stages down
+
+    :return: list of dicts with the stage, seconds, max_rss_mb (peak memory of the process by the end of the stage)
+             and traced_peak_mb (None without trace_memory).
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from egm722 import render
+    from egm722.export import OutputBatch
+    from egm722.geometry import for_dpi, load_geometry
+    from egm722.lookup import build_country_lookup
+    from egm722.stats import batch_statistics
+    from egm722.timeseries import trend_summary
+
+    temporary = output_dir is None
+    output_dir = tempfile.mkdtemp(prefix='egm722_benchmark_') if temporary else output_dir
+    data = {}
+
+    def load():
+        data['population_df'] = pd.read_csv(population_csv, na_values=NO_DATA)
+        data['counties_UA'] = load_geometry(counties_UA_shp, cache_dir=None)
+        data['countries'] = load_geometry(countries_shp, cache_dir=None)
+
+    def join():
+        data['lookup'] = build_country_lookup(data['counties_UA'], data['countries'])
+
+    def merge():
+        data['cube'] = PopulationCube.from_frame(data['population_df'], data['lookup'][COUNTRY_ID])
+        data['counties_UA_population'] = render.counties_UA_population_frame(data['counties_UA'], data['cube'])
+
+    def stats():
+        cube = data['cube']
+        for year in cube.years:
+            cube.year_statistics(year)
+        data['statistics'] = batch_statistics(cube)
+        data['trends'] = trend_summary(cube, cube.years[0], cube.years[-1])
+
+    def export():
+        cube, select_year = data['cube'], str(data['cube'].years[-1])
+        with OutputBatch(output_dir) as outputs:
+            outputs.add(cube.to_frame(), 'country_population_all')
+            outputs.add(cube.to_frame(years=[select_year]).sort_values([select_year], ascending=[False]),
+                        '{}_{}'.format(COUNTIES_UA_ID, select_year))
+            outputs.add(data['statistics'], 'population_statistics_all_years')
+            outputs.add(data['trends'], 'population_trends')
+            outputs.add(for_dpi(data['counties_UA_population']), 'counties_UA_population')
+
+    def draw():
+        select_year = str(data['cube'].years[-1])
+        fig = render.year_map(for_dpi(data['counties_UA_population'], dpi), select_year)
+        fig.savefig(os.path.join(output_dir, 'UK population_{}.png'.format(select_year)), dpi=dpi, bbox_inches='tight')
+        fig_pie = render.country_pie(data['cube'].country_all_year(select_year), select_year)
+        fig_pie.savefig(os.path.join(output_dir, 'country_population_{}.png'.format(select_year)), dpi=dpi,
+                        bbox_inches='tight')
+        plt.close('all')
+
+    steps = dict(zip(STAGES, (load, join, merge, stats, export, draw)))
+    last = max(STAGES.index(stage) for stage in stages)
+    results = []
+    try:
+        for stage in STAGES[:last + 1]:
+            if trace_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            steps[stage]()
+            seconds = time.perf_counter() - start
+            traced_peak = None
+            if trace_memory:
+                traced_peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+                tracemalloc.stop()
+            if stage in stages:
+                results.append({'stage': stage, 'seconds': seconds, 'max_rss_mb': max_rss_mb(),
+                                'traced_peak_mb': traced_peak})
+    finally:
+        if temporary:
+            shutil.rmtree(output_dir, ignore_errors=True)
+    return results
+
+
+def _benchmark_scale(scale, data_dir, vertices, seed, stages, dpi, trace_memory, repeat):
+    """ Runs the stages on one synthetic dataset, keeping the fastest time of each stage over the repeats. """
+    population_csv, counties_UA_shp = synthetic_paths(data_dir, scale, vertices, seed)
+    runs = [run_stages(population_csv, counties_UA_shp, stages=stages, dpi=dpi, trace_memory=trace_memory)
+            for _ in range(repeat)]
+    results = []
+    for stage_runs in zip(*runs):
+        best = dict(min(stage_runs, key=lambda result: result['seconds']))
+        best['max_rss_mb'] = max(result['max_rss_mb'] or 0 for result in stage_runs) or None
+        results.append(best)
+    return results
+
+
+def _in_new_process(function, *args):
+    """ Runs a function in a fresh process, so the peak memory recorded is that of the one dataset. """
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+        return pool.submit(function, *args).result()
+
+
+def environment():
+    """ Versions and hardware of the benchmark run, recorded with the results. """
+    import geopandas
+    import matplotlib
+    import shapely
+    return {'time': datetime.datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+            'platform': platform.platform(), 'processor': platform.processor(), 'cpus': os.cpu_count(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'geopandas': geopandas.__version__,
+            'shapely': shapely.__version__, 'matplotlib': matplotlib.__version__}
+
+
+def run_benchmarks(scales=SCALES, stages=STAGES, data_dir=None, vertices=VERTICES, seed=722, dpi=100,
+                   trace_memory=False, repeat=1):
+    """ Generates the synthetic datasets and benchmarks each one in its own process.
+
+    :param scales: (list) dataset sizes as multiples of the training data, e.g. [10, 100, 1000]
+    :param stages: (list) stages to report, from STAGES
+    :param data_dir: (str) folder to keep the synthetic datasets in for later runs, a temporary folder if None
+    :param vertices: (int) vertices per synthetic polygon
+    :param seed: (int) random seed of the synthetic data
+    :param dpi: (int) resolution of the rendered figures
+    :param trace_memory: (bool) also record tracemalloc peak memory of each stage
+    :param repeat: (int) number of times the stages are run, the fastest time is kept
+
+    :return: dict with the 'environment', the benchmark 'settings' and a 'results' list with a record for each scale
+             and stage: scale, rows, vertices, stage, seconds, max_rss_mb and traced_peak_mb.
+    """
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        raise ValueError('{} are not benchmark stages, choose from {}.'.format(unknown, STAGES))
+    rows = len(pd.read_csv(POPULATION_CSV, usecols=[COUNTIES_UA_ID]))
+    temporary = data_dir is None
+    data_dir = tempfile.mkdtemp(prefix='egm722_synthetic_') if temporary else data_dir
+    records = []
+    try:
+        for scale in scales:
+            _in_new_process(synthetic_data, scale, data_dir, vertices, seed)
+            for result in _in_new_process(_benchmark_scale, scale, data_dir, vertices, seed, list(stages), dpi,
+                                          trace_memory, repeat):
+                records.append(dict({'scale': scale, 'rows': rows * scale, 'vertices': vertices}, **result))
+                print('x{:<5} {:<7} {:9.3f} s {:>9} MB'.format(scale, result['stage'], result['seconds'],
+                                                               '{:.0f}'.format(result['max_rss_mb'] or 0)))
+    finally:
+        if temporary:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return {'environment': environment(),
+            'settings': {'scales': list(scales), 'stages': list(stages), 'vertices': vertices, 'seed': seed,
+                         'dpi': dpi, 'repeat': repeat, 'trace_memory': trace_memory},
+            'results': records}
+
+
+def compare(results, baseline):
+    """ Times of a benchmark run relative to an earlier run of the same scales and stages.
+
+    :param results: (dict) benchmark results, as returned by run_benchmarks()
+    :param baseline: (dict) earlier benchmark results, e.g. loaded from its .json file
+
+    :return: DataFrame indexed by scale and stage with the baseline and current seconds and peak memory and the time
+             ratio (current / baseline, above 1 is slower).
+    """
+    columns = ['scale', 'stage', 'seconds', 'max_rss_mb']
+    current = pd.DataFrame(results['results'], columns=columns).set_index(['scale', 'stage'])
+    previous = pd.DataFrame(baseline['results'], columns=columns).set_index(['scale', 'stage'])
+    table = previous.join(current, how='inner', lsuffix='_baseline')
+    table['ratio'] = table['seconds'] / table['seconds_baseline']
+    return table
+
+
+def default_output():
+    return os.path.join(REPO_DIR, 'benchmarks', 'benchmark_{:%Y%m%d_%H%M%S}.json'.format(datetime.datetime.now()))
+
+
+def main(argv=None):
+    """ Runs the benchmarks from the command line, e.g. python -m egm722.benchmark --scales 10,100 """
+    parser = argparse.ArgumentParser(description='Time and memory of each analysis stage on synthetic datasets.')
+    parser.add_argument('--scales', default=','.join(str(scale) for scale in SCALES),
+                        help='dataset sizes as multiples of the training data, e.g. 10,100,1000')
+    parser.add_argument('--stages', default=','.join(STAGES), help='stages to report, e.g. load,join,stats')
+    parser.add_argument('--data-dir', default=None, help='keep the synthetic datasets in this folder for reuse')
+    parser.add_argument('--vertices', type=int, default=VERTICES, help='vertices per synthetic polygon')
+    parser.add_argument('--seed', type=int, default=722, help='random seed of the synthetic data')
+    parser.add_argument('--dpi', type=int, default=100, help='resolution of the rendered figures')
+    parser.add_argument('--repeat', type=int, default=1, help='runs of each stage, the fastest is kept')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='also record the peak memory allocated in each stage (tracemalloc, slower)')
+    parser.add_argument('--output', default=None, help='results .json, benchmarks/benchmark_<time>.json by default')
+    parser.add_argument('--compare', default=None, help='results .json of an earlier run to compare with')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks([int(scale) for scale in args.scales.split(',')],
+                             [stage.strip() for stage in args.stages.split(',')], args.data_dir, args.vertices,
+                             args.seed, args.dpi, args.trace_memory, args.repeat)
+    output = args.output or default_output()
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print('Saved ' + output)
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(results, json.load(f)).to_string(float_format='{:.3f}'.format))
+
+
+if __name__ == '__main__':
+    main()
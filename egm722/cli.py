@@ -0,0 +1,245 @@
+# Command line interface: one subcommand per analysis of the assignment script, importing only what the subcommand
+# needs (the stats/county/country/change commands never import geopandas, cartopy or matplotlib once the
+# county/UA -> country lookup has been cached).
+#
+#   python -m egm722 country England --year 2006
+#   python -m egm722 --importtime stats 2002
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from egm722.cube import COUNTIES_UA_SHP, COUNTRIES_SHP, OUTPUT_DIR, POPULATION_CSV, parse_year_pairs
+
+
+def load_cube(args):
+    from egm722.cube import PopulationCube
+    return PopulationCube.from_files(args.population_csv, args.counties_shp, args.countries_shp)
+
+
+def output_batch(args):
+    """ OutputBatch for the tables of a command if --write was given, otherwise None (print only). """
+    if not args.write:
+        return None
+    from egm722.export import OutputBatch
+    return OutputBatch(args.output_dir, args.format)
+
+
+def run_stats(args):
+    from egm722.analysis import year_population
+    cube = load_cube(args)
+    if args.level:
+        from egm722.stats import batch_statistics, select_statistics
+        print(select_statistics(batch_statistics(cube, levels=[args.level]), args.level, args.year).to_string(
+            index=False))
+        return None
+    outputs = output_batch(args)
+    year_population(cube, args.year, outputs=outputs)
+    return outputs
+
+
+def run_county(args):
+    from egm722.analysis import counties_UA_population_data
+    outputs = output_batch(args)
+    counties_UA_population_data(load_cube(args), args.name, outputs)
+    return outputs
+
+
+def run_country(args):
+    from egm722.analysis import country_all_year, country_year_population
+    cube = load_cube(args)
+    outputs = output_batch(args)
+    if args.name is None:
+        country_all_year(cube, args.year, outputs)
+        return outputs
+    country_year_population(cube, args.name, args.year, outputs)
+    return outputs
+
+
+def run_change(args):
+    from egm722.analysis import counties_UA_population_change
+    cube = load_cube(args)
+    if args.trends:
+        from egm722.timeseries import trend_summary
+        trends = trend_summary(cube, args.start, args.end)
+        print(trends)
+        outputs = output_batch(args)
+        if outputs is not None:
+            outputs.add(trends, 'population_trends_{}_{}'.format(args.start, args.end))
+        return outputs
+    outputs = output_batch(args)
+    counties_UA_population_change(cube, args.start, args.end, outputs)
+    return outputs
+
+
+def run_map(args):
+    import matplotlib
+    matplotlib.use('Agg')
+    from egm722 import render
+    from egm722.export import change_map_path, year_map_path
+    from egm722.geometry import for_dpi, load_geometry
+    cube = load_cube(args)
+    map_population = for_dpi(render.counties_UA_population_frame(load_geometry(args.counties_shp), cube), args.dpi)
+    if args.end is None:
+        fig, path = render.year_map(map_population, args.year), year_map_path(args.output_dir, args.year)
+    else:
+        fig = render.change_map(map_population, args.year, args.end)
+        path = change_map_path(args.output_dir, args.year, args.end)
+    os.makedirs(args.output_dir, exist_ok=True)
+    fig.savefig(path, dpi=args.dpi, bbox_inches='tight')
+    print(path)
+
+
+def run_pie(args):
+    import matplotlib
+    matplotlib.use('Agg')
+    from egm722 import render
+    from egm722.export import country_pie_path
+    cube = load_cube(args)
+    fig_pie = render.country_pie(cube.country_all_year(args.year), args.year)
+    path = country_pie_path(args.output_dir, args.year)
+    os.makedirs(args.output_dir, exist_ok=True)
+    fig_pie.savefig(path, dpi=args.dpi, bbox_inches='tight')
+    print(path)
+
+
+def run_web(args):
+    from egm722.webmap import QUANTIZATION, export_webmap
+    output_dir = os.path.join(args.output_dir, 'web')
+    written = export_webmap(load_cube(args), args.counties_shp, output_dir,
+                            parse_year_pairs(args.pairs) if args.pairs else None, args.tolerance, args.dpi,
+                            args.quantization or QUANTIZATION, args.force)
+    print('Interactive map files written to {} (geometry {})'.format(output_dir, 'rewritten' if written['geometry']
+                                                                      else 'up to date'))
+
+
+def run_scenarios(args):
+    from egm722.scenarios import RESULTS_NAME, run_scenarios as run_batch
+    results = run_batch(args.file, args.population_csv, args.counties_shp, args.countries_shp, args.output_dir,
+                        args.format, args.dpi, args.workers)
+    print('{} scenarios, results in {}'.format(len(results), os.path.join(args.output_dir, RESULTS_NAME)))
+    for _, row in results[results['error'].notna()].iterrows():
+        print('  {}: {}'.format(row['scenario'], row['error']))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m egm722',
+                                     description='UK county/unitary authority population statistics and maps.')
+    parser.add_argument('--population-csv', default=POPULATION_CSV, help='population table')
+    parser.add_argument('--counties-shp', default=COUNTIES_UA_SHP, help='counties/unitary authority shapefile')
+    parser.add_argument('--countries-shp', default=COUNTRIES_SHP, help='country shapefile')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help='folder for tables and figures')
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet', 'feather'], help='table format')
+    parser.add_argument('--write', action='store_true', help='also save the tables to the output folder')
+    parser.add_argument('--importtime', action='store_true',
+                        help='report the time spent importing each package (python -X importtime) and in total')
+    parser.add_argument('--profile', action='store_true',
+                        help='print the time, CPU time and rows of each stage of the command when it ends')
+    parser.add_argument('--profile-log', default=None, help='also save the stage profile to this .json file')
+    parser.add_argument('--cprofile-dir', default=None, help='save a cProfile .prof file of each stage to this folder')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    stats = commands.add_parser('stats', help='mean, largest, smallest and total county/UA population for a year')
+    stats.add_argument('year')
+    stats.add_argument('--level', choices=['UA', 'country', 'UK'],
+                       help='print the batch statistics (rank, change) of a grouping level instead')
+    stats.set_defaults(run=run_stats)
+
+    county = commands.add_parser('county', help='population of a county/UA for every year')
+    county.add_argument('name', help='county/unitary authority name or ID, e.g. Conwy')
+    county.set_defaults(run=run_county)
+
+    country = commands.add_parser('country', help='country total population for a year, all countries if no name')
+    country.add_argument('name', nargs='?', help='country name, e.g. England')
+    country.add_argument('--year', required=True)
+    country.set_defaults(run=run_country)
+
+    change = commands.add_parser('change', help='county/UA population change between two years')
+    change.add_argument('start')
+    change.add_argument('end')
+    change.add_argument('--trends', action='store_true', help='also CAGR and trend fits of every county/UA')
+    change.set_defaults(run=run_change)
+
+    map_parser = commands.add_parser('map', help='population map of a year, or population change map of two years')
+    map_parser.add_argument('year')
+    map_parser.add_argument('end', nargs='?', help='end year for a population change map')
+    map_parser.add_argument('--dpi', type=int, default=300)
+    map_parser.set_defaults(run=run_map)
+
+    pie = commands.add_parser('pie', help='pie-chart of the country populations for a year')
+    pie.add_argument('year')
+    pie.add_argument('--dpi', type=int, default=300)
+    pie.set_defaults(run=run_pie)
+
+    web = commands.add_parser('web', help='TopoJSON geometry and per-year population files for browser maps')
+    web.add_argument('--pairs', default=None, help='change periods, e.g. 2002:2019,1991:2019')
+    web.add_argument('--tolerance', type=float, default=None, help='simplification tolerance in metres')
+    web.add_argument('--dpi', type=int, default=300, help='map resolution of the default tolerance')
+    web.add_argument('--quantization', type=int, default=None, help='TopoJSON grid size, 100000 by default')
+    web.add_argument('--force', action='store_true', help='rewrite the geometry')
+    web.set_defaults(run=run_web)
+
+    scenarios = commands.add_parser('scenarios', help='answer a batch of scenarios from a .yaml or .json file')
+    scenarios.add_argument('file', help='scenario file, see egm722/scenarios.py')
+    scenarios.add_argument('--dpi', type=int, default=300, help='resolution of the scenario maps')
+    scenarios.add_argument('--workers', type=int, default=None, help='map rendering processes')
+    scenarios.set_defaults(run=run_scenarios)
+    return parser
+
+
+def import_report(stderr, wall_time, top=15):
+    """ Summarises python -X importtime output: total import time and the packages that took longest to import.
+
+    :param stderr: (str) stderr of a python -X importtime run
+    :param wall_time: (float) wall time of the run in seconds
+    :param top: (int) number of packages listed
+
+    :return: (str) report table.
+    """
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    total = sum(packages.values())
+    lines = ['Startup report: {:.3f} s total, {:.3f} s importing {} packages'.format(
+        wall_time, total / 1e6, len(packages)), '{:>10}  {:>6}  package'.format('import s', '%')]
+    for package, us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        lines.append('{:>10.3f}  {:>6.1f}  {}'.format(us / 1e6, 100 * us / max(total, 1), package))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.importtime:
+        # run the same command again under -X importtime, which writes one line per imported module to stderr
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'egm722'] +
+                                [arg for arg in argv if arg != '--importtime'], stderr=subprocess.PIPE, text=True)
+        wall_time = time.perf_counter() - start
+        errors = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+        if errors:
+            print('\n'.join(errors), file=sys.stderr)
+        print(import_report(result.stderr, wall_time), file=sys.stderr)
+        return result.returncode
+
+    profiler = None
+    if args.profile or args.profile_log or args.cprofile_dir:
+        from egm722.profiling import start_profiling
+        profiler = start_profiling(cprofile=args.cprofile_dir is not None, profile_dir=args.cprofile_dir)
+    try:
+        outputs = args.run(args)
+    except (KeyError, ValueError) as e:  # an unknown year, county/UA or country, or years in the wrong order
+        parser.error(e.args[0] if e.args else str(e))
+    if outputs is not None:
+        for path in outputs.commit():
+            print('Saved ' + path)
+    if profiler is not None:
+        profiler.report(args.profile_log, file=sys.stderr)
+    return 0
@@ -0,0 +1,273 @@
+# In-memory population cube: the population table parsed once into a dense (county/UA, year) array so that year,
+# county and country queries are array slices rather than repeated merges and boolean-mask scans.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from egm722.lookup import build_country_lookup, load_country_lookup
+from egm722.profiling import profiled
+
+# training data and outputs folders of the repository, pass other paths to the functions to use own data
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(REPO_DIR, 'data_files')
+OUTPUT_DIR = os.path.join(REPO_DIR, 'outputs')
+POPULATION_CSV = os.path.join(DATA_DIR, 'population_number.csv')  # UK population data from 1991 to 2019
+COUNTIES_UA_SHP = os.path.join(DATA_DIR, 'Counties_and_Unitary_Authorities.shp')  # 2020 UK Counties and UA
+COUNTRIES_SHP = os.path.join(DATA_DIR, 'Countries_(December_2020)_UK_BUC.shp')  # 2020 UK countries
+
+# column titles of the training data, if using own data modify these to match
+COUNTIES_UA_ID = 'CTYUA20CD'  # title of data column with county/UA identifier
+COUNTIES_UA_NAME = 'County / unitary (as of April 2021)'  # title of data column with county/UA name
+COUNTRY_ID = 'CTRY20NM'  # title of data column with country identifier
+NO_DATA = ['-', ':', '..']  # nodata markers used in ONS/NOMIS tables, no data collected for Ireland 1991-2000
+
+
+def year_columns(population_df):
+    """ Finds the year columns (e.g. '1991' to '2019') of a wide population table.
+
+    :param population_df: (DataFrame) population table with one column per year
+
+    :return: list of the year column titles (str) in the order they appear in the table.
+    """
+    return [col for col in population_df.columns if str(col).strip().isdigit()]
+
+
+def parse_year_pairs(text):
+    """ Reads year pairs such as '1991:2019,2002:2019' into a list of (start year, end year) tuples. """
+    return [tuple(int(yr) for yr in pair.split(':')) for pair in text.split(',') if pair.strip()]
+
+
+def country_assignment(counties_UA, countries, counties_UA_id=COUNTIES_UA_ID, country_id=COUNTRY_ID):
+    """ Assigns each county/UA to a country, see egm722.lookup.build_country_lookup() for the rules used.
+
+    :param counties_UA: (GeoDataFrame) counties/unitary authority polygons
+    :param countries: (GeoDataFrame) country polygons
+    :param counties_UA_id: (str) column containing counties/unitary authority unique ID
+    :param country_id: (str) column containing countries unique ID
+
+    :return: Series of country names indexed by county/UA ID.
+    """
+    return build_country_lookup(counties_UA, countries, counties_UA_id, country_id)[country_id]
+
+
+class PopulationCube:
+    """ Dense (county/UA x year) population array with index maps for county/UA ID, name, year and country.
+
+    Built once from the population table, after which year, county/UA and country queries are slices of the array.
+    Country totals for every year are summed when the cube is built, so a country/year total is a single lookup.
+    Missing population (nodata) is held as NaN and skipped in sums and statistics, as pandas does.
+    """
+
+    def __init__(self, ids, names, countries, years, values, counties_UA_id=COUNTIES_UA_ID,
+                 counties_UA_name=COUNTIES_UA_NAME, country_id=COUNTRY_ID):
+        """
+        :param ids: (list) county/unitary authority unique IDs, one per row of values
+        :param names: (list) county/unitary authority names, one per row of values
+        :param countries: (list) country name of each county/UA, None/NaN where not known
+        :param years: (list) years (int or str), one per column of values
+        :param values: (array) population array of shape (len(ids), len(years))
+        :param counties_UA_id: (str) column title used for county/UA IDs in output tables
+        :param counties_UA_name: (str) column title used for county/UA names in output tables
+        :param country_id: (str) column title used for country names in output tables
+        """
+        self.ids = np.asarray(ids, dtype=object)
+        self.names = np.asarray(names, dtype=object)
+        self.years = np.asarray([int(yr) for yr in years])
+        self.values = np.asarray(values, dtype='float64')
+        if self.values.shape != (len(self.ids), len(self.years)):
+            raise ValueError('values has shape {}, expected {}.'.format(self.values.shape,
+                                                                       (len(self.ids), len(self.years))))
+        self.counties_UA_id = counties_UA_id
+        self.counties_UA_name = counties_UA_name
+        self.country_id = country_id
+
+        self.id_index = {county_id: i for i, county_id in enumerate(self.ids)}
+        self.name_index = {name: i for i, name in enumerate(self.names)}
+        self.year_index = {year: j for j, year in enumerate(self.years)}
+
+        # country codes per row, -1 where the county/UA has no country assigned
+        countries = pd.Series(countries, dtype=object)
+        self.country_names = np.asarray(sorted(countries.dropna().unique()), dtype=object)
+        self.country_index = {name: k for k, name in enumerate(self.country_names)}
+        self.country_codes = np.asarray([self.country_index.get(name, -1) for name in countries], dtype='int64')
+        self.countries = np.asarray(countries, dtype=object)
+        self.country_rows = {name: np.flatnonzero(self.country_codes == k) for name, k in self.country_index.items()}
+
+        # precomputed (country x year) totals, nodata counts as zero as in DataFrame.sum()
+        assigned = self.country_codes >= 0
+        self.country_totals = np.zeros((len(self.country_names), len(self.years)))
+        np.add.at(self.country_totals, self.country_codes[assigned], np.nan_to_num(self.values[assigned]))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return '<PopulationCube {} counties/UA x {} years ({}-{})>'.format(len(self.ids), len(self.years),
+                                                                          self.years.min(), self.years.max())
+
+    @classmethod
+    @profiled('PopulationCube.from_frame')
+    def from_frame(cls, population_df, countries=None, counties_UA_id=COUNTIES_UA_ID,
+                   counties_UA_name=COUNTIES_UA_NAME, country_id=COUNTRY_ID):
+        """ Builds the cube from a wide population table (one row per county/UA, one column per year).
+
+        :param population_df: (DataFrame) population table, e.g. read from population_number.csv
+        :param countries: (Series) country names indexed by county/UA ID, e.g. from country_assignment()
+        :param counties_UA_id: (str) column containing counties/unitary authority unique ID
+        :param counties_UA_name: (str) column containing counties/unitary authority name
+        :param country_id: (str) column title used for country names in output tables
+
+        :return: PopulationCube
+        """
+        years = year_columns(population_df)
+        values = population_df[years].apply(pd.to_numeric, args=('coerce',)).to_numpy(dtype='float64',
+                                                                                    na_value=np.nan)
+            # removes any non-number/nodata in a single pass over the year columns
+        ids = population_df[counties_UA_id].to_numpy()
+        if countries is None:
+            country_names = [None] * len(ids)
+        else:
+            country_names = pd.Series(countries).reindex(ids).to_numpy()
+        return cls(ids, population_df[counties_UA_name].to_numpy(), country_names, years, values,
+                   counties_UA_id=counties_UA_id, counties_UA_name=counties_UA_name, country_id=country_id)
+
+    @classmethod
+    def from_frames(cls, population_df, counties_UA, countries, counties_UA_id=COUNTIES_UA_ID,
+                    counties_UA_name=COUNTIES_UA_NAME, country_id=COUNTRY_ID):
+        """ Builds the cube from an already loaded population table, counties/UA and country layers.
+
+        :param population_df: (DataFrame) population table
+        :param counties_UA: (GeoDataFrame) counties/unitary authority polygons
+        :param countries: (GeoDataFrame) country polygons
+        :param counties_UA_id: (str) column containing counties/unitary authority unique ID
+        :param counties_UA_name: (str) column containing counties/unitary authority name
+        :param country_id: (str) column containing countries unique ID
+
+        :return: PopulationCube
+        """
+        country_of = country_assignment(counties_UA, countries, counties_UA_id, country_id)
+        return cls.from_frame(population_df, country_of, counties_UA_id, counties_UA_name, country_id)
+
+    @classmethod
+    @profiled('PopulationCube.from_files')
+    def from_files(cls, population_csv=POPULATION_CSV, counties_UA_shp=COUNTIES_UA_SHP, countries_shp=COUNTRIES_SHP,
+                   counties_UA_id=COUNTIES_UA_ID, counties_UA_name=COUNTIES_UA_NAME, country_id=COUNTRY_ID):
+        """ Reads the population .csv and builds the cube, with countries from the persisted county/UA -> country
+        lookup table (built from the counties/UA and country shapefiles the first time they are used).
+
+        :param population_csv: (str) path to the population table, e.g. population_number.csv
+        :param counties_UA_shp: (str) path to the counties/unitary authority shapefile
+        :param countries_shp: (str) path to the country shapefile
+        :param counties_UA_id: (str) column containing counties/unitary authority unique ID
+        :param counties_UA_name: (str) column containing counties/unitary authority name
+        :param country_id: (str) column containing countries unique ID
+
+        :return: PopulationCube
+        """
+        population_df = pd.read_csv(population_csv, na_values=NO_DATA)
+        country_lookup = load_country_lookup(counties_UA_shp, countries_shp, counties_UA_id=counties_UA_id,
+                                             country_id=country_id)
+        return cls.from_frame(population_df, country_lookup[country_id], counties_UA_id, counties_UA_name, country_id)
+
+    # index lookups ----------------------------------------------------------------------------------------------------
+
+    def year_position(self, select_year):
+        """ Column of the cube for a year, raises KeyError if the year is not in the data range.
+
+        :param select_year: (str or int) year within the dataset
+
+        :return: (int) column position of the year.
+        """
+        try:
+            return self.year_index[int(select_year)]
+        except (KeyError, ValueError):
+            raise KeyError('{} is outside the data range for years ({}-{}).'.format(
+                select_year, self.years.min(), self.years.max())) from None
+
+    def county_position(self, select_county_UA):
+        """ Row of the cube for a county/UA, looked up by name or by unique ID.
+
+        :param select_county_UA: (str) county/unitary authority name or ID
+
+        :return: (int) row position of the county/UA.
+        """
+        if select_county_UA in self.name_index:
+            return self.name_index[select_county_UA]
+        if select_county_UA in self.id_index:
+            return self.id_index[select_county_UA]
+        raise KeyError('{} is not a county/unitary authority in the data.'.format(select_county_UA))
+
+    def country_position(self, select_country):
+        """ Row of the country totals for a country name (case-insensitive, e.g. 'england').
+
+        :param select_country: (str) country name
+
+        :return: (int) row position of the country in country_totals.
+        """
+        for name, k in self.country_index.items():
+            if name.lower() == str(select_country).lower():
+                return k
+        raise KeyError('{} is not a country in the data.'.format(select_country))
+
+    # queries ----------------------------------------------------------------------------------------------------------
+
+    def year(self, select_year):
+        """ Population of every county/UA for a year, a view of one column of the cube. """
+        return self.values[:, self.year_position(select_year)]
+
+    def county(self, select_county_UA):
+        """ Population of a county/UA for every year, a view of one row of the cube. """
+        return self.values[self.county_position(select_county_UA)]
+
+    def country_rows_of(self, select_country):
+        """ Row positions of the counties/UA in a country. """
+        return self.country_rows[self.country_names[self.country_position(select_country)]]
+
+    def country_year(self, select_country, select_year):
+        """ Total population of a country for a year. """
+        return self.country_totals[self.country_position(select_country), self.year_position(select_year)]
+
+    def country_all_year(self, select_year):
+        """ Total population of every country for a year as a Series indexed by country name. """
+        totals = self.country_totals[:, self.year_position(select_year)]
+        if np.array_equal(totals, np.round(totals)):
+            totals = totals.astype('int64')  # population counts are shown as whole numbers, as in the table
+        return pd.Series(totals, index=self.country_names, name=str(int(select_year))).rename_axis(self.country_id)
+
+    def change(self, select_year, select_year1):
+        """ Population change of every county/UA between two years (select_year1 - select_year). """
+        return self.values[:, self.year_position(select_year1)] - self.values[:, self.year_position(select_year)]
+
+    def year_statistics(self, select_year):
+        """ Mean, largest, smallest and total county/UA population for a year, nodata skipped.
+
+        :param select_year: (str or int) year within the dataset
+
+        :return: dict with keys 'mean', 'max', 'min' and 'sum'.
+        """
+        column = self.year(select_year)
+        return {'mean': np.nanmean(column), 'max': np.nanmax(column), 'min': np.nanmin(column),
+                'sum': np.nansum(column)}
+
+    # tables -----------------------------------------------------------------------------------------------------------
+
+    def to_frame(self, rows=None, years=None):
+        """ Returns the cube (or a selection of it) as a wide table in the layout of population_number.csv.
+
+        :param rows: (array) row positions to include, all counties/UA if None
+        :param years: (list) years to include, all years if None
+
+        :return: DataFrame with county/UA name, ID and country columns followed by one column per year.
+        """
+        rows = np.arange(len(self.ids)) if rows is None else np.asarray(rows)
+        cols = np.arange(len(self.years)) if years is None else np.asarray([self.year_position(yr) for yr in years])
+        selection = self.values[np.ix_(rows, cols)]
+        table = pd.DataFrame(selection, columns=[str(yr) for yr in self.years[cols]])
+        if np.array_equal(selection[~np.isnan(selection)], np.round(selection[~np.isnan(selection)])):
+            table = table.astype('Int64')  # population counts are written as whole numbers, nodata left empty
+        table.insert(0, self.counties_UA_name, self.names[rows])
+        table.insert(1, self.counties_UA_id, self.ids[rows])
+        table.insert(2, self.country_id, self.countries[rows])
+        return table
@@ -0,0 +1,185 @@
+# Output tables: pluggable writers (.csv, Parquet, Feather) that leave geometry out of the tables by default, and a
+# batch that writes a run's tables together and atomically into an output folder.
+
+import os
+import stat
+import tempfile
+
+import pandas as pd
+
+from egm722.cube import COUNTIES_UA_ID, OUTPUT_DIR
+from egm722.profiling import stage
+
+GEOMETRY_MODES = ('drop', 'id', 'keep')
+FILE_MODE = 0o644  # permissions of new output files, rather than mkstemp's private 0600
+
+
+def _write_csv(table, path):
+    table.to_csv(path, index=False)  # GeoDataFrame geometry is written as WKT
+
+
+def _write_parquet(table, path):
+    table.to_parquet(path, index=False)  # GeoDataFrame geometry is written as GeoParquet (WKB)
+
+
+def _write_feather(table, path):
+    table.reset_index(drop=True).to_feather(path)
+
+
+WRITERS = {'csv': ('.csv', _write_csv),
+           'parquet': ('.parquet', _write_parquet),
+           'feather': ('.feather', _write_feather)}
+
+
+def register_writer(fmt, extension, writer):
+    """ Adds an output format, e.g. register_writer('json', '.json', lambda table, path: table.to_json(path)).
+
+    :param fmt: (str) name of the format, as passed to write_table() and OutputBatch
+    :param extension: (str) file extension, including the dot
+    :param writer: (function) writer(table, path) that writes a DataFrame to path
+    """
+    WRITERS[fmt] = (extension, writer)
+
+
+def geometry_columns(table):
+    """ Columns of a table holding geometry (the active geometry and any other GeoSeries columns). """
+    return [col for col in table.columns if str(table[col].dtype) == 'geometry']
+
+
+def prepare_table(table, geometry='id', id_column=COUNTIES_UA_ID):
+    """ Removes or keeps the geometry of a table before it is written.
+
+    :param table: (DataFrame or GeoDataFrame) table to write
+    :param geometry: (str) 'drop' to leave out geometry, 'id' to leave out geometry and keep id_column as the reference
+                     to the counties/UA geometry (the geometry cache or shapefile), 'keep' to write the geometry
+    :param id_column: (str) column referencing the geometry, required for geometry='id' if the table has geometry
+
+    :return: DataFrame (or GeoDataFrame for geometry='keep') to write.
+    """
+    if geometry not in GEOMETRY_MODES:
+        raise ValueError('{} is not a geometry option, choose from {}.'.format(geometry, GEOMETRY_MODES))
+    columns = geometry_columns(table)
+    if geometry == 'keep' or not columns:
+        return table
+    if geometry == 'id' and id_column not in table:
+        raise ValueError('Cannot reference geometry by ID, the table has no {} column.'.format(id_column))
+    return pd.DataFrame(table.drop(columns=columns))
+
+
+def year_map_path(output_dir, select_year):
+    """ File name of a year map, as saved by the script. """
+    return os.path.join(output_dir, 'UK population_{}.png'.format(select_year))
+
+
+def change_map_path(output_dir, select_year, select_year1):
+    """ File name of a population change map, as saved by the script. """
+    return os.path.join(output_dir, 'Population change_{}_{}.png'.format(select_year, select_year1))
+
+
+def country_pie_path(output_dir, select_year):
+    """ File name of a country pie-chart, as saved by the script. """
+    return os.path.join(output_dir, 'country_population_{}.png'.format(select_year))
+
+
+def write_atomic(table, path, writer):
+    """ Writes to a temporary file in the output folder and renames it over path, so path is never half written. """
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path), suffix='.tmp', dir=directory)
+    os.close(handle)
+    try:
+        writer(table, tmp_path)
+        # a replaced file keeps its permissions
+        os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode) if os.path.exists(path) else FILE_MODE)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
+def write_table(table, name, output_dir=OUTPUT_DIR, fmt='csv', geometry='id', id_column=COUNTIES_UA_ID):
+    """ Writes a single table to the output folder.
+
+    :param table: (DataFrame or GeoDataFrame) table to write
+    :param name: (str) file name without extension, e.g. 'country_England_population'
+    :param output_dir: (str) output folder, created if needed
+    :param fmt: (str) output format, 'csv', 'parquet', 'feather' or a format added with register_writer()
+    :param geometry: (str) 'drop', 'id' or 'keep', see prepare_table()
+    :param id_column: (str) column referencing the geometry
+
+    :return: (str) path of the written file.
+    """
+    batch = OutputBatch(output_dir, fmt, geometry, id_column)
+    batch.add(table, name)
+    return batch.commit()[0]
+
+
+class OutputBatch:
+    """ Collects a run's output tables and writes them together.
+
+    Tables are written to temporary files and only renamed into the output folder once every table of the batch has
+    been written, so a failed run leaves the previous outputs in place rather than a mix of old and new files. Used as
+    a context manager the batch is committed when the block ends without an error.
+    """
+
+    def __init__(self, output_dir=OUTPUT_DIR, fmt='csv', geometry='id', id_column=COUNTIES_UA_ID):
+        """
+        :param output_dir: (str) output folder, created if needed
+        :param fmt: (str) output format, 'csv', 'parquet', 'feather' or a format added with register_writer()
+        :param geometry: (str) 'drop', 'id' or 'keep', see prepare_table()
+        :param id_column: (str) column referencing the geometry
+        """
+        if fmt not in WRITERS:
+            raise ValueError('{} is not an output format, choose from {}.'.format(fmt, sorted(WRITERS)))
+        if geometry not in GEOMETRY_MODES:
+            raise ValueError('{} is not a geometry option, choose from {}.'.format(geometry, GEOMETRY_MODES))
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.geometry = geometry
+        self.id_column = id_column
+        self.tables = {}
+
+    def path(self, name):
+        """ Path a table of the given name is written to. """
+        return os.path.join(self.output_dir, name + WRITERS[self.fmt][0])
+
+    def add(self, table, name):
+        """ Adds a table to the batch, replacing any table added earlier under the same name.
+
+        :param table: (DataFrame or GeoDataFrame) table to write
+        :param name: (str) file name without extension
+
+        :return: (str) path the table will be written to.
+        """
+        self.tables[name] = prepare_table(table, self.geometry, self.id_column)
+        return self.path(name)
+
+    def commit(self):
+        """ Writes every table of the batch and empties it.
+
+        :return: list of the written paths, in the order the tables were added.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        writer = WRITERS[self.fmt][1]
+        written = []
+        try:
+            with stage('OutputBatch.commit', rows=sum(len(table) for table in self.tables.values())):
+                for name, table in self.tables.items():
+                    with stage('write ' + name, rows=len(table)):
+                        written.append((write_atomic(table, self.path(name), writer), self.path(name)))
+        except BaseException:
+            for tmp_path, _ in written:
+                os.remove(tmp_path)
+            raise
+        for tmp_path, path in written:
+            os.replace(tmp_path, path)
+        self.tables = {}
+        return [path for _, path in written]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.tables = {}
@@ -0,0 +1,136 @@
+# Geometry store: shapefiles parsed once and cached as GeoParquet (or Feather), already projected to OSGB (epsg 27700)
+# with centrepoints and simplified outlines for each output dpi, so later runs skip shapefile parsing and figures do
+# not draw coastline detail finer than a pixel.
+
+import glob
+import hashlib
+import os
+import re
+
+from egm722.profiling import profiled
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache')
+OSGB_EPSG = 27700  # epsg code of the training data and the figures, if using other data modify this
+MAP_DPIS = (100, 300)  # output resolutions to keep simplified geometry for
+MAP_SIZE = 10  # figure size in inches (the maps are 10x10)
+SHAPEFILE_PARTS = ('.shp', '.shx', '.dbf', '.prj', '.cpg')
+FORMATS = {'parquet': ('.parquet', 'read_parquet', 'to_parquet'),  # extension, geopandas reader, GeoDataFrame writer
+           'feather': ('.feather', 'read_feather', 'to_feather')}
+
+
+def source_hash(shp_path):
+    """ Fingerprint of a shapefile, the SHA-1 of the contents of the .shp and its sidecar files.
+
+    :param shp_path: (str) path to the .shp file
+
+    :return: (str) hexadecimal hash, which changes whenever any part of the shapefile changes.
+    """
+    digest = hashlib.sha1()
+    stem = os.path.splitext(shp_path)[0]
+    for ext in SHAPEFILE_PARTS:
+        part = stem + ext
+        if os.path.exists(part):
+            digest.update(ext.encode())
+            with open(part, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+def simplify_tolerance(total_bounds, dpi, size=MAP_SIZE):
+    """ Ground distance covered by one pixel of a map of the given extent and resolution.
+
+    :param total_bounds: (array) xmin, ymin, xmax, ymax of the mapped data in metres
+    :param dpi: (int) resolution of the saved figure
+    :param size: (float) figure size in inches
+
+    :return: (float) tolerance in metres, vertices closer together than this cannot be told apart on the map.
+    """
+    xmin, ymin, xmax, ymax = total_bounds
+    return max(xmax - xmin, ymax - ymin) / (size * dpi)
+
+
+def simplified_column(dpi):
+    """ Name of the column holding the geometry simplified for a dpi. """
+    return 'geometry_{}dpi'.format(dpi)
+
+
+def cache_path(shp_path, cache_dir=CACHE_DIR, fmt='parquet'):
+    """ Path of the cached copy of a shapefile, keyed by the shapefile name and source_hash(). """
+    stem = os.path.splitext(os.path.basename(shp_path))[0]
+    return os.path.join(cache_dir, '{}_{}{}'.format(stem, source_hash(shp_path)[:16], FORMATS[fmt][0]))
+
+
+@profiled('read shapefile')
+def build_geometry(shp_path, dpis=MAP_DPIS, epsg=OSGB_EPSG):
+    """ Reads a shapefile, projects it and adds the centrepoint and simplified geometry columns.
+
+    :param shp_path: (str) path to the .shp file
+    :param dpis: (tuple) output resolutions to simplify the geometry for
+    :param epsg: (int) epsg code to project the geometry to
+
+    :return: GeoDataFrame with the full resolution 'geometry', a 'centroid' column and a geometry_<dpi>dpi column for
+             each dpi.
+    """
+    import geopandas as gpd  # imported when a shapefile is parsed, not when this module is
+    layer = gpd.read_file(shp_path)
+    if layer.crs is None or layer.crs.to_epsg() != epsg:
+        layer = layer.to_crs(epsg=epsg)
+    layer['centroid'] = layer['geometry'].centroid
+    for dpi in dpis:
+        tolerance = simplify_tolerance(layer.total_bounds, dpi)
+        layer[simplified_column(dpi)] = layer['geometry'].simplify(tolerance, preserve_topology=True)
+    return layer
+
+
+@profiled()
+def load_geometry(shp_path, cache_dir=CACHE_DIR, dpis=MAP_DPIS, epsg=OSGB_EPSG, fmt='parquet'):
+    """ Loads a shapefile through the geometry cache, parsing the shapefile only if it has changed since last cached.
+
+    :param shp_path: (str) path to the .shp file
+    :param cache_dir: (str) folder of the cached files, None to always read the shapefile
+    :param dpis: (tuple) output resolutions to keep simplified geometry for
+    :param epsg: (int) epsg code to project the geometry to
+    :param fmt: (str) cache file format, 'parquet' (GeoParquet) or 'feather'
+
+    :return: GeoDataFrame as returned by build_geometry().
+    """
+    if cache_dir is None:
+        return build_geometry(shp_path, dpis, epsg)
+    import geopandas as gpd
+    path = cache_path(shp_path, cache_dir, fmt)
+    ext, read, write = FORMATS[fmt]
+    if os.path.exists(path):
+        layer = getattr(gpd, read)(path)
+        if all(simplified_column(dpi) in layer for dpi in dpis) and layer.crs.to_epsg() == epsg:
+            return layer
+
+    layer = build_geometry(shp_path, dpis, epsg)
+    os.makedirs(cache_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(shp_path))[0]
+    copy = re.compile(re.escape(stem) + '_[0-9a-f]{16}' + re.escape(ext) + '$')  # not other shapefiles named stem_...
+    for stale in glob.glob(os.path.join(cache_dir, glob.escape(stem) + '_*' + ext)):
+        if copy.match(os.path.basename(stale)):
+            os.remove(stale)  # copies of older versions of the shapefile
+    getattr(layer, write)(path + '.tmp')
+    os.replace(path + '.tmp', path)  # a half-written cache file is never read
+    return layer
+
+
+def for_dpi(layer, dpi=None):
+    """ Selects the geometry to draw at a resolution and drops the other cached geometry columns.
+
+    :param layer: (GeoDataFrame) layer returned by load_geometry(), or a table merged with it
+    :param dpi: (int) resolution of the figure, the smallest cached dpi at or above it is used (the largest cached dpi
+                if none is), None for the full resolution geometry
+
+    :return: GeoDataFrame with a single 'geometry' column.
+    """
+    cached = sorted(int(col[len('geometry_'):-len('dpi')]) for col in layer.columns
+                    if col.startswith('geometry_') and col.endswith('dpi'))
+    extra = ['centroid'] + [simplified_column(level) for level in cached]
+    selected = layer.drop(columns=[col for col in extra if col in layer])
+    if dpi is not None and cached:
+        level = next((level for level in cached if level >= dpi), cached[-1])
+        selected['geometry'] = layer[simplified_column(level)].values
+    return selected
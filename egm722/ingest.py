@@ -0,0 +1,191 @@
+# Streaming ingest of wide population tables: the .csv is read in chunks with compact dtypes (int32 population,
+# categorical names/IDs) and written, without geometry, to a Parquet store that can be read back column by column or
+# in batches. Lets tables at ward/LSOA/output area scale go through the analysis without holding them in memory.
+#
+#   python -m egm722.ingest data_files/population_number.csv cache/population.parquet
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from egm722.cube import COUNTIES_UA_ID, COUNTIES_UA_NAME, COUNTRY_ID, NO_DATA, PopulationCube, year_columns
+
+POPULATION_DTYPE = 'Int32'  # nullable int32, population counts are well below 2**31 and nodata stays empty
+
+
+def ingest_population(population_csv, store_path, chunksize=100000, country_lookup=None,
+                      counties_UA_id=COUNTIES_UA_ID, counties_UA_name=COUNTIES_UA_NAME, country_id=COUNTRY_ID):
+    """ Reads a wide population .csv in chunks and writes its attribute columns to a Parquet store.
+
+    Only one chunk is held in memory at a time. Year columns are stored as int32 and the name, ID and country columns
+    as dictionary (categorical) columns, each chunk is written as one row group of the store.
+
+    :param population_csv: (str) path to the population table, one row per area and one column per year
+    :param store_path: (str) path of the Parquet file to write
+    :param chunksize: (int) number of rows read and written at a time
+    :param country_lookup: (Series) country names indexed by area ID, e.g. from egm722.lookup.load_country_lookup(),
+                           adds a country column to the store if given
+    :param counties_UA_id: (str) column containing the area unique ID
+    :param counties_UA_name: (str) column containing the area name
+    :param country_id: (str) column title for the country names
+
+    :return: (int) number of rows written.
+    """
+    years = year_columns(pd.read_csv(population_csv, nrows=0))
+    dtypes = {counties_UA_id: 'category', counties_UA_name: 'category'}
+    dtypes.update({year: POPULATION_DTYPE for year in years})
+    columns = [counties_UA_name, counties_UA_id] + years
+
+    os.makedirs(os.path.dirname(os.path.abspath(store_path)), exist_ok=True)
+    writer = None
+    rows = 0
+    try:
+        for chunk in pd.read_csv(population_csv, usecols=columns, dtype=dtypes, na_values=NO_DATA,
+                                 chunksize=chunksize):
+            chunk = chunk[columns]
+            if country_lookup is not None:
+                chunk.insert(2, country_id, pd.Categorical(chunk[counties_UA_id].map(country_lookup)))
+            if writer is None:  # int32 dictionary indices, so later chunks can have any number of categories
+                schema = pa.schema([(col, pa.int32() if col in years else pa.dictionary(pa.int32(), pa.string()))
+                                    for col in chunk.columns])
+                writer = pq.ParquetWriter(store_path + '.tmp', schema)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError('{} has no rows.'.format(population_csv))
+    os.replace(store_path + '.tmp', store_path)  # the store is only replaced once fully written
+    return rows
+
+
+def store_years(store_path):
+    """ Year columns (str) held in a population store, read from the Parquet schema without loading any rows. """
+    return [name for name in pq.read_schema(store_path).names if name.strip().isdigit()]
+
+
+def read_population_store(store_path, years=None, columns=None):
+    """ Reads selected columns of a population store into memory.
+
+    :param store_path: (str) path of the Parquet store
+    :param years: (list) years to read, all years if None
+    :param columns: (list) other columns to read, all non-year columns if None
+
+    :return: DataFrame with the selected columns, year columns as nullable int32.
+    """
+    schema_names = pq.read_schema(store_path).names
+    if columns is None:
+        columns = [name for name in schema_names if not name.strip().isdigit()]
+    year_names = store_years(store_path) if years is None else [str(int(yr)) for yr in years]
+    return pd.read_parquet(store_path, columns=list(columns) + year_names)
+
+
+def iter_population_store(store_path, years=None, columns=None, batch_size=100000):
+    """ Reads a population store in batches of rows, so only one batch is held in memory at a time.
+
+    :param store_path: (str) path of the Parquet store
+    :param years: (list) years to read, all years if None
+    :param columns: (list) other columns to read, all non-year columns if None
+    :param batch_size: (int) maximum number of rows per batch
+
+    :return: generator of DataFrames.
+    """
+    store = pq.ParquetFile(store_path)
+    if columns is None:
+        columns = [name for name in store.schema_arrow.names if not name.strip().isdigit()]
+    year_names = store_years(store_path) if years is None else [str(int(yr)) for yr in years]
+    for batch in store.iter_batches(batch_size=batch_size, columns=list(columns) + year_names):
+        yield batch.to_pandas()
+
+
+def stream_year_statistics(store_path, years=None, group_by=None, batch_size=100000):
+    """ Total, mean, smallest and largest area population for every year, computed batch by batch.
+
+    The same figures as PopulationCube.year_statistics() (and, grouped by country, the country totals) for stores too
+    large to load at once.
+
+    :param store_path: (str) path of the Parquet store
+    :param years: (list) years to summarise, all years if None
+    :param group_by: (str) column to group the areas by (e.g. the country column), None for the whole store
+    :param batch_size: (int) maximum number of rows held in memory at a time
+
+    :return: DataFrame with one row per year (and group) and columns sum, count, mean, min and max.
+    """
+    year_names = store_years(store_path) if years is None else [str(int(yr)) for yr in years]
+    columns = [] if group_by is None else [group_by]
+    total = count = low = high = None
+    for batch in iter_population_store(store_path, year_names, columns, batch_size):
+        values = batch[year_names].astype('float64')  # one batch at a time, nodata as NaN
+        keys = batch[group_by].astype(object).to_numpy() if group_by else np.zeros(len(batch), dtype='int64')
+        grouped = values.groupby(keys)
+        if total is None:
+            total, count, low, high = grouped.sum(), grouped.count(), grouped.min(), grouped.max()
+        else:  # running totals, groups new to this batch are added
+            total = total.add(grouped.sum(), fill_value=0)
+            count = count.add(grouped.count(), fill_value=0)
+            low = low.combine(grouped.min(), np.fmin)
+            high = high.combine(grouped.max(), np.fmax)
+    if total is None:
+        raise ValueError('{} has no rows.'.format(store_path))
+
+    groups = total.index
+    index = pd.MultiIndex.from_product([groups, [int(yr) for yr in year_names]], names=[group_by or 'group', 'year'])
+    statistics = pd.DataFrame({name: table.reindex(index=groups, columns=year_names).to_numpy().ravel()
+                               for name, table in [('sum', total), ('count', count), ('min', low), ('max', high)]},
+                              index=index)
+    statistics['count'] = statistics['count'].astype('int64')
+    statistics.loc[statistics['count'] == 0, 'sum'] = np.nan  # no data for the group in that year
+    statistics['mean'] = statistics['sum'] / statistics['count']
+    statistics = statistics[['sum', 'count', 'mean', 'min', 'max']]
+    return statistics.droplevel(0) if group_by is None else statistics
+
+
+def cube_from_store(store_path, years=None, counties_UA_id=COUNTIES_UA_ID, counties_UA_name=COUNTIES_UA_NAME,
+                    country_id=COUNTRY_ID):
+    """ Builds a PopulationCube from a population store, reading only the selected years.
+
+    :param store_path: (str) path of the Parquet store
+    :param years: (list) years to load into the cube, all years if None
+    :param counties_UA_id: (str) column containing the area unique ID
+    :param counties_UA_name: (str) column containing the area name
+    :param country_id: (str) column containing the country names, if the store has one
+
+    :return: PopulationCube
+    """
+    schema_names = pq.read_schema(store_path).names
+    columns = [counties_UA_name, counties_UA_id] + ([country_id] if country_id in schema_names else [])
+    population_df = read_population_store(store_path, years, columns)
+    countries = None
+    if country_id in population_df:
+        countries = pd.Series(population_df[country_id].astype(object).to_numpy(),
+                              index=population_df[counties_UA_id].astype(object).to_numpy())
+    population_df[[counties_UA_name, counties_UA_id]] = population_df[[counties_UA_name, counties_UA_id]].astype(object)
+    return PopulationCube.from_frame(population_df, countries, counties_UA_id, counties_UA_name, country_id)
+
+
+def main(argv=None):
+    """ Ingests a population .csv from the command line, e.g. python -m egm722.ingest population.csv store.parquet """
+    parser = argparse.ArgumentParser(description='Stream a wide population .csv into a compact Parquet store.')
+    parser.add_argument('population_csv', help='population table, one row per area and one column per year')
+    parser.add_argument('store_path', help='Parquet file to write')
+    parser.add_argument('--chunksize', type=int, default=100000, help='rows read and written at a time')
+    parser.add_argument('--countries', action='store_true',
+                        help='add a country column from the counties/UA -> country lookup of the training data')
+    args = parser.parse_args(argv)
+
+    country_lookup = None
+    if args.countries:
+        from egm722.cube import COUNTIES_UA_SHP, COUNTRIES_SHP
+        from egm722.lookup import load_country_lookup
+        country_lookup = load_country_lookup(COUNTIES_UA_SHP, COUNTRIES_SHP)[COUNTRY_ID]
+    rows = ingest_population(args.population_csv, args.store_path, args.chunksize, country_lookup)
+    print('Wrote {:,} rows and {} years to {}'.format(rows, len(store_years(args.store_path)), args.store_path))
+
+
+if __name__ == '__main__':
+    main()
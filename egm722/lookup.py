@@ -0,0 +1,108 @@
+# County/UA -> country lookup table: built once from the counties/UA and country polygons and kept in the cache folder,
+# so the analysis reads a small table instead of running a spatial join on every run.
+
+import hashlib
+import os
+
+import pandas as pd
+
+from egm722.geometry import CACHE_DIR, load_geometry, source_hash
+from egm722.profiling import profiled
+
+
+def points_within(points, ids, countries, country_id):
+    """ Country containing each point, found with a spatial join (which uses the country polygons' spatial index).
+
+    :param points: (GeoSeries) one point per county/UA
+    :param ids: (array) county/UA IDs, in the order of points
+    :param countries: (GeoDataFrame) country polygons
+    :param country_id: (str) column containing countries unique ID
+
+    :return: Series of country names indexed by county/UA ID, only for the points inside a country.
+    """
+    import geopandas as gpd  # only needed when the lookup table is built
+    points = gpd.GeoDataFrame({'county_UA': ids}, geometry=points.values, crs=countries.crs)
+    joined = gpd.sjoin(points, countries[[country_id, 'geometry']], how='inner')
+    found = pd.Series(joined[country_id].to_numpy(), index=joined['county_UA'].to_numpy())
+    return found[~found.index.duplicated()]
+
+
+@profiled()
+def build_country_lookup(counties_UA, countries, counties_UA_id='CTYUA20CD', country_id='CTRY20NM'):
+    """ Assigns every county/unitary authority to the country it lies in.
+
+    A county/UA is assigned to the country containing its centrepoint. Where the centrepoint falls outside every
+    country (e.g. island groups or estuaries where the centrepoint is in the sea) the rules below are tried in turn:
+
+        representative_point - the country containing a point guaranteed to be inside the county/UA polygon
+        overlap - the country the county/UA polygon overlaps by the largest area
+        nearest - the nearest country polygon
+
+    :param counties_UA: (GeoDataFrame) counties/unitary authority polygons, with a 'centroid' column if loaded through
+                        the geometry cache
+    :param countries: (GeoDataFrame) country polygons, in the same crs as counties_UA
+    :param counties_UA_id: (str) column containing counties/unitary authority unique ID
+    :param country_id: (str) column containing countries unique ID
+
+    :return: DataFrame indexed by county/UA ID with the country_id column and a 'method' column naming the rule used.
+    """
+    ids = counties_UA[counties_UA_id].to_numpy()
+    geometry = counties_UA['geometry']
+    centrepoints = counties_UA['centroid'] if 'centroid' in counties_UA else geometry.centroid
+    lookup = pd.DataFrame({country_id: pd.Series(index=ids, dtype=object), 'method': None})
+
+    def assign(found, method):
+        found = found[lookup.loc[found.index, country_id].isna().to_numpy()]
+        lookup.loc[found.index, country_id] = found.to_numpy()
+        lookup.loc[found.index, 'method'] = method
+
+    assign(points_within(centrepoints, ids, countries, country_id), 'centroid')
+    missing = lookup[country_id].isna().to_numpy()
+    if missing.any():
+        assign(points_within(geometry[missing].representative_point(), ids[missing], countries, country_id),
+               'representative_point')
+
+    missing = lookup[country_id].isna().to_numpy()
+    for county_id, polygon in zip(ids[missing], geometry[missing]):
+        candidates = countries.sindex.query(polygon, predicate='intersects')
+        if len(candidates):
+            overlap = countries['geometry'].iloc[candidates].intersection(polygon).area
+            country = countries[country_id].iloc[candidates[overlap.to_numpy().argmax()]]
+            method = 'overlap'
+        else:
+            country = countries[country_id].iloc[countries.distance(polygon).to_numpy().argmin()]
+            method = 'nearest'
+        lookup.loc[county_id, [country_id, 'method']] = [country, method]
+    return lookup.rename_axis(counties_UA_id)
+
+
+def lookup_path(counties_UA_shp, countries_shp, cache_dir=CACHE_DIR, counties_UA_id='CTYUA20CD', country_id='CTRY20NM'):
+    """ Path of the persisted lookup table, keyed by the hashes of both shapefiles and the ID columns used. """
+    columns = hashlib.sha1('{}\x1f{}'.format(counties_UA_id, country_id).encode()).hexdigest()
+    key = source_hash(counties_UA_shp)[:8] + source_hash(countries_shp)[:8] + columns[:8]
+    return os.path.join(cache_dir, 'county_country_lookup_{}.csv'.format(key))
+
+
+@profiled()
+def load_country_lookup(counties_UA_shp, countries_shp, cache_dir=CACHE_DIR, counties_UA_id='CTYUA20CD',
+                        country_id='CTRY20NM'):
+    """ Loads the county/UA -> country lookup table, building and saving it the first time the shapefiles are used.
+
+    :param counties_UA_shp: (str) path to the counties/unitary authority shapefile
+    :param countries_shp: (str) path to the country shapefile
+    :param cache_dir: (str) folder of the persisted table
+    :param counties_UA_id: (str) column containing counties/unitary authority unique ID
+    :param country_id: (str) column containing countries unique ID
+
+    :return: DataFrame as returned by build_country_lookup().
+    """
+    path = lookup_path(counties_UA_shp, countries_shp, cache_dir, counties_UA_id, country_id)
+    if os.path.exists(path):
+        return pd.read_csv(path, index_col=counties_UA_id)
+
+    lookup = build_country_lookup(load_geometry(counties_UA_shp, cache_dir), load_geometry(countries_shp, cache_dir),
+                                  counties_UA_id, country_id)
+    os.makedirs(cache_dir, exist_ok=True)
+    lookup.to_csv(path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return lookup
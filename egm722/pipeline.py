@@ -0,0 +1,250 @@
+# Incremental output pipeline: every input is fingerprinted (each shapefile, and each column of the population .csv)
+# and every output table/figure records the fingerprints of the inputs it was made from. A run rebuilds only the
+# outputs whose inputs changed or which are new, e.g. adding a 2020 column builds the 2020 tables and maps and the
+# all-years tables, and leaves the 1991-2019 outputs alone.
+#
+#   python -m egm722.pipeline --output-dir outputs
+
+import argparse
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+import pandas as pd
+
+from egm722.cube import (COUNTIES_UA_ID, COUNTIES_UA_NAME, COUNTIES_UA_SHP, COUNTRIES_SHP, OUTPUT_DIR, POPULATION_CSV,
+                         PopulationCube, year_columns)
+from egm722.export import WRITERS, OutputBatch, change_map_path, country_pie_path, year_map_path
+from egm722.geometry import source_hash
+from egm722.stats import batch_statistics
+
+MANIFEST = '.pipeline_manifest.json'  # kept in the output folder
+TABLE_SETTINGS = ('setting:geometry',)  # run settings that change the tables
+FIGURE_SETTINGS = ('setting:dpi',)  # run settings that change the maps and pie-charts
+
+# kind - 'all_table', 'statistics_table', 'country_table', 'year_table', 'year_map', 'change_map' or 'pie',
+# params - year(s)/country of the output, deps - keys of the inputs and settings it is made from, path - output file
+Target = namedtuple('Target', ['name', 'kind', 'params', 'deps', 'path'])
+
+
+def fingerprint_inputs(population_csv=POPULATION_CSV, counties_UA_shp=COUNTIES_UA_SHP, countries_shp=COUNTRIES_SHP,
+                       counties_UA_id=COUNTIES_UA_ID, counties_UA_name=COUNTIES_UA_NAME):
+    """ Fingerprints each input of the analysis.
+
+    :param population_csv: (str) path to the population table
+    :param counties_UA_shp: (str) path to the counties/unitary authority shapefile
+    :param countries_shp: (str) path to the country shapefile
+    :param counties_UA_id: (str) column containing counties/unitary authority unique ID
+    :param counties_UA_name: (str) column containing counties/unitary authority name
+
+    :return: dict of input key -> hash. Keys are 'counties_UA' and 'countries' for the shapefiles, 'rows' for the
+             population table's county/UA names and IDs and 'population:<year>' for each year column.
+    """
+    population_df = pd.read_csv(population_csv, dtype=str, keep_default_na=False)  # fingerprint the text as written
+
+    def column_hash(*columns):
+        digest = hashlib.sha1()
+        for col in columns:
+            digest.update('\x1f'.join(population_df[col]).encode())
+        return digest.hexdigest()
+
+    fingerprints = {'counties_UA': source_hash(counties_UA_shp), 'countries': source_hash(countries_shp),
+                    'rows': column_hash(counties_UA_id, counties_UA_name)}
+    for year in year_columns(population_df):
+        fingerprints['population:' + year] = column_hash(counties_UA_id, year)
+    return fingerprints
+
+
+def plan_targets(years, countries, change_pairs, output_dir=OUTPUT_DIR, fmt='csv', maps=True,
+                 counties_UA_id=COUNTIES_UA_ID):
+    """ Lists the outputs of a run and the inputs and settings each depends on.
+
+    :param years: (list) years of the population data, year tables, maps and pie-charts are made for each
+    :param countries: (list) country names, a table is made for each
+    :param change_pairs: (list) (start year, end year) pairs to make population change maps for
+    :param output_dir: (str) output folder
+    :param fmt: (str) output table format
+    :param maps: (bool) include the maps and pie-charts
+    :param counties_UA_id: (str) column containing counties/unitary authority unique ID
+
+    :return: list of Target.
+    """
+    ext = WRITERS[fmt][0]
+    all_years = tuple('population:{}'.format(yr) for yr in years)
+    countries_deps = ('rows', 'counties_UA', 'countries')
+    targets = [Target('country_population_all', 'all_table', None, countries_deps + all_years + TABLE_SETTINGS,
+                      os.path.join(output_dir, 'country_population_all' + ext)),
+               Target('population_statistics_all_years', 'statistics_table', None,
+                      countries_deps + all_years + TABLE_SETTINGS,
+                      os.path.join(output_dir, 'population_statistics_all_years' + ext))]
+    for country in countries:
+        name = 'country_{}_population'.format(country)
+        targets.append(Target(name, 'country_table', country, countries_deps + all_years + TABLE_SETTINGS,
+                              os.path.join(output_dir, name + ext)))
+    for year in years:
+        name = '{}_{}'.format(counties_UA_id, year)
+        targets.append(Target(name, 'year_table', year, ('rows', 'population:{}'.format(year)) + TABLE_SETTINGS,
+                              os.path.join(output_dir, name + ext)))
+    if maps:
+        for year in years:
+            targets.append(Target('year_map_{}'.format(year), 'year_map', year,
+                                  ('rows', 'counties_UA', 'population:{}'.format(year)) + FIGURE_SETTINGS,
+                                  year_map_path(output_dir, year)))
+            targets.append(Target('pie_{}'.format(year), 'pie', year,
+                                  countries_deps + ('population:{}'.format(year),) + FIGURE_SETTINGS,
+                                  country_pie_path(output_dir, year)))
+        for start, end in change_pairs:
+            targets.append(Target('change_map_{}_{}'.format(start, end), 'change_map', (start, end),
+                                  ('rows', 'counties_UA', 'population:{}'.format(start), 'population:{}'.format(end))
+                                  + FIGURE_SETTINGS, change_map_path(output_dir, start, end)))
+    return targets
+
+
+def load_manifest(output_dir):
+    """ Fingerprints recorded for each output by the last run, an empty dict if there has been no run. """
+    path = os.path.join(output_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def stale_targets(targets, fingerprints, manifest):
+    """ Targets that need building: new, missing from the output folder, or made from inputs that have changed.
+
+    :param targets: (list) Target list from plan_targets()
+    :param fingerprints: (dict) current input fingerprints from fingerprint_inputs() and the run settings
+    :param manifest: (dict) fingerprints recorded by the last run, from load_manifest()
+
+    :return: list of Target.
+    """
+    stale = []
+    for target in targets:
+        recorded = manifest.get(target.name)
+        current = {key: fingerprints.get(key) for key in target.deps}
+        if recorded is None or recorded.get('deps') != current or recorded.get('path') != target.path \
+                or not os.path.exists(target.path):
+            stale.append(target)
+    return stale
+
+
+def build_tables(cube, targets, batch, counties_UA_id=COUNTIES_UA_ID, counties_UA_name=COUNTIES_UA_NAME):
+    """ Adds the table targets to an output batch, made from the population cube as the script makes them. """
+    for target in targets:
+        if target.kind == 'all_table':
+            table = cube.to_frame()
+        elif target.kind == 'statistics_table':
+            table = batch_statistics(cube)
+        elif target.kind == 'country_table':
+            table = cube.to_frame(rows=cube.country_rows_of(target.params))
+        else:
+            select_year = str(target.params)
+            table = cube.to_frame(years=[select_year])[[counties_UA_name, counties_UA_id, select_year]]
+            table = table.sort_values([select_year], ascending=[False])
+        batch.add(table, target.name)
+
+
+def build_figures(cube, targets, counties_UA_shp, output_dir, dpi, workers):
+    """ Renders the map targets across worker processes and the pie-chart targets in this process. """
+    import matplotlib.pyplot as plt
+    from egm722 import render
+    from egm722.geometry import load_geometry
+
+    map_years = [target.params for target in targets if target.kind == 'year_map']
+    pairs = [target.params for target in targets if target.kind == 'change_map']
+    if map_years or pairs:
+        counties_UA_population = render.counties_UA_population_frame(load_geometry(counties_UA_shp), cube)
+        render.render_atlas(counties_UA_population, map_years, pairs, output_dir, dpi, workers)
+    for target in targets:
+        if target.kind == 'pie':
+            fig_pie = render.country_pie(cube.country_all_year(target.params), target.params)
+            fig_pie.savefig(target.path, dpi=dpi, bbox_inches='tight')
+            plt.close(fig_pie)
+
+
+def run_pipeline(population_csv=POPULATION_CSV, counties_UA_shp=COUNTIES_UA_SHP, countries_shp=COUNTRIES_SHP,
+                 output_dir=OUTPUT_DIR, fmt='csv', geometry='id', maps=True, change_pairs=None, dpi=300,
+                 workers=None, force=False):
+    """ Brings the output folder up to date with the inputs, rebuilding only what depends on changed inputs.
+
+    :param population_csv: (str) path to the population table
+    :param counties_UA_shp: (str) path to the counties/unitary authority shapefile
+    :param countries_shp: (str) path to the country shapefile
+    :param output_dir: (str) output folder
+    :param fmt: (str) output table format, 'csv', 'parquet' or 'feather'
+    :param geometry: (str) geometry option of the output tables, see egm722.export.prepare_table()
+    :param maps: (bool) also make the year maps, change maps and pie-charts
+    :param change_pairs: (list) (start year, end year) pairs for change maps, defaults to first year to latest year
+    :param dpi: (int) resolution of the figures
+    :param workers: (int) number of map rendering processes, defaults to the number of CPUs
+    :param force: (bool) rebuild every output
+
+    :return: dict with the names of the 'built' and 'skipped' outputs.
+    """
+    fingerprints = fingerprint_inputs(population_csv, counties_UA_shp, countries_shp)
+    fingerprints.update({'setting:geometry': geometry, 'setting:dpi': dpi})  # outputs made with other settings rebuild
+    years = sorted(int(key.split(':')[1]) for key in fingerprints if key.startswith('population:'))
+    change_pairs = [(years[0], years[-1])] if change_pairs is None else change_pairs
+
+    cube = None
+    manifest = {} if force else load_manifest(output_dir)
+    countries = []
+    if not force and manifest.get('_countries', {}).get('deps') == {key: fingerprints[key] for key in
+                                                                       ('rows', 'counties_UA', 'countries')}:
+        countries = manifest['_countries']['names']  # country list of the last run, no need to load the data
+    else:
+        cube = PopulationCube.from_files(population_csv, counties_UA_shp, countries_shp)
+        countries = list(cube.country_names)
+
+    targets = plan_targets(years, countries, change_pairs, output_dir, fmt, maps)
+    stale = stale_targets(targets, fingerprints, manifest)
+    if stale:
+        cube = cube or PopulationCube.from_files(population_csv, counties_UA_shp, countries_shp)
+        with OutputBatch(output_dir, fmt, geometry) as batch:
+            build_tables(cube, [target for target in stale if target.kind.endswith('_table')], batch)
+        figures = [target for target in stale if not target.kind.endswith('_table')]
+        if figures:
+            build_figures(cube, figures, counties_UA_shp, output_dir, dpi, workers)
+
+    manifest = {target.name: manifest[target.name] for target in targets if target.name in manifest}
+    for target in stale:
+        manifest[target.name] = {'deps': {key: fingerprints.get(key) for key in target.deps}, 'path': target.path}
+    manifest['_countries'] = {'deps': {key: fingerprints[key] for key in ('rows', 'counties_UA', 'countries')},
+                              'names': countries}
+    save_manifest(output_dir, manifest)
+    stale_names = {target.name for target in stale}
+    return {'built': [target.name for target in targets if target.name in stale_names],
+            'skipped': [target.name for target in targets if target.name not in stale_names]}
+
+
+def main(argv=None):
+    """ Updates the outputs from the command line, e.g. python -m egm722.pipeline --no-maps """
+    parser = argparse.ArgumentParser(description='Rebuild only the population outputs whose inputs have changed.')
+    parser.add_argument('--population-csv', default=POPULATION_CSV, help='population table')
+    parser.add_argument('--counties-shp', default=COUNTIES_UA_SHP, help='counties/unitary authority shapefile')
+    parser.add_argument('--countries-shp', default=COUNTRIES_SHP, help='country shapefile')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help='output folder')
+    parser.add_argument('--format', default='csv', choices=sorted(WRITERS), help='output table format')
+    parser.add_argument('--no-maps', action='store_true', help='tables only, no maps or pie-charts')
+    parser.add_argument('--dpi', type=int, default=300, help='resolution of the figures')
+    parser.add_argument('--workers', type=int, default=None, help='map rendering processes')
+    parser.add_argument('--force', action='store_true', help='rebuild every output')
+    args = parser.parse_args(argv)
+
+    result = run_pipeline(args.population_csv, args.counties_shp, args.countries_shp, args.output_dir, args.format,
+                          maps=not args.no_maps, dpi=args.dpi, workers=args.workers, force=args.force)
+    print('Built {} outputs, {} up to date.'.format(len(result['built']), len(result['skipped'])))
+    for name in result['built']:
+        print('  ' + name)
+
+
+if __name__ == '__main__':
+    main()
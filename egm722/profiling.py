@@ -0,0 +1,274 @@
+# Run profiling: the time, CPU time, rows and memory of each stage of a run (shapefile loading, the country lookup,
+# each analysis function, table writing and each figure), printed as a table at the end of the run or saved as a .json
+# log, with optional cProfile output per stage to see which functions inside a stage take the time.
+#
+#   profiler = start_profiling()
+#   with stage('year map'):
+#       fig.savefig(...)
+#   profiler.report('outputs/run_profile.json')
+#
+# Profiling is off until start_profiling() is called, the profiled() functions of the package then run as normal.
+
+import cProfile
+import functools
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource  # peak resident memory of the process, not available on Windows
+except ImportError:
+    resource = None
+
+
+def max_rss_mb():
+    """ Peak resident memory of this process so far in MB, None where it cannot be read. """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, kB on Linux
+
+
+def count_rows(result):
+    """ Rows of a table, array, list or PopulationCube returned by a stage, None for other results. """
+    if hasattr(result, 'shape') and len(result.shape):
+        return int(result.shape[0])
+    if hasattr(result, '__len__') and not isinstance(result, (str, bytes, dict)):
+        return len(result)
+    return None
+
+
+class Stage:
+    """ Measurements of one stage of a run. Set rows inside the with block if the stage knows how many it processed.
+    """
+
+    def __init__(self, name, depth, parent, rows=None):
+        self.name = name
+        self.depth = depth
+        self.parent = parent
+        self.rows = rows
+        self.start = None
+        self.wall_s = None
+        self.cpu_s = None
+        self.rss_growth_mb = None
+        self.memory_delta_mb = None
+        self.memory_peak_mb = None
+        self.profile = None
+        self.child_peak = 0
+
+    def record(self):
+        return {'name': self.name, 'depth': self.depth, 'parent': self.parent, 'start_s': self.start,
+                'wall_s': self.wall_s, 'cpu_s': self.cpu_s, 'rows': self.rows, 'rss_growth_mb': self.rss_growth_mb,
+                'memory_delta_mb': self.memory_delta_mb, 'memory_peak_mb': self.memory_peak_mb,
+                'profile': self.profile}
+
+
+class _NullStage:
+    """ Stands in for a Stage while profiling is off. """
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class Profiler:
+    """ Records the stages of a run. Stages can be nested, e.g. the shapefile parsing inside the geometry loading. """
+
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.cprofile = False
+        self.profile_dir = None
+        self.stages = []
+        self._stack = []
+        self._cprofile_active = False
+        self._started = time.perf_counter()
+
+    def start(self, memory=False, cprofile=False, profile_dir=None):
+        """ Starts recording, clearing any stages recorded before.
+
+        :param memory: (bool) also measure the memory allocated within each stage with tracemalloc (memory_delta_mb,
+                       the memory still held at the end of the stage, and memory_peak_mb). This slows the run down,
+                       heavily for stages that create many small objects such as writing .csv files.
+        :param cprofile: (bool) run cProfile during each outermost stage and save its stats as <stage>.prof
+        :param profile_dir: (str) folder for the .prof files, the current folder if None
+        """
+        self.enabled = True
+        self.memory = memory
+        self.cprofile = cprofile
+        self.profile_dir = profile_dir
+        self.stages = []
+        self._stack = []
+        self._started = time.perf_counter()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        """ Stops recording, the recorded stages are kept. """
+        self.enabled = False
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def stage(self, name, rows=None):
+        """ Context manager measuring the code run inside it as a stage.
+
+        :param name: (str) name of the stage, e.g. 'year map'
+        :param rows: (int) rows processed by the stage, can also be set on the returned Stage inside the with block
+
+        :return: Stage (or a stand-in doing nothing while profiling is off).
+        """
+        if not self.enabled:
+            return _NullStage()
+        stage = Stage(name, len(self._stack), self._stack[-1].name if self._stack else None, rows)
+        profile = None
+        if self.cprofile and not self._cprofile_active:  # only one cProfile can run at once, nested stages are in it
+            profile = cProfile.Profile()
+            self._cprofile_active = True
+        return _StageContext(self, stage, profile)
+
+    def _profile_path(self, name):
+        folder = self.profile_dir or os.getcwd()
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, re.sub(r'[^\w.-]+', '_', name).strip('_') + '.prof')
+
+    def summary(self):
+        """ Table of the recorded stages in the order they started, nested stages indented under their parent.
+
+        :return: DataFrame with the stage name, wall and CPU seconds, rows, rows a second and memory columns.
+        """
+        import pandas as pd
+        table = pd.DataFrame([stage.record() for stage in sorted(self.stages, key=lambda stage: stage.start)],
+                             columns=list(Stage('', 0, None).record()))
+        table['name'] = ['  ' * depth + name for depth, name in zip(table['depth'], table['name'])]
+        table['rows'] = table['rows'].astype('Int64')
+        table['rows_per_s'] = table['rows'].astype('float64') / table['wall_s']
+        columns = ['name', 'wall_s', 'cpu_s', 'rows', 'rows_per_s', 'rss_growth_mb']
+        if self.memory:
+            columns += ['memory_delta_mb', 'memory_peak_mb']
+        return table[columns]
+
+    def save(self, path):
+        """ Saves the recorded stages as a .json log.
+
+        :param path: (str) .json file to write
+
+        :return: (str) path
+        """
+        log = {'python': sys.version.split()[0], 'memory': self.memory, 'cprofile': self.cprofile,
+               'total_s': time.perf_counter() - self._started,
+               'stages': [stage.record() for stage in sorted(self.stages, key=lambda stage: stage.start)]}
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(log, f, indent=1)
+        return path
+
+    def report(self, path=None, file=None):
+        """ Prints the summary table and, if a path is given, saves the .json log.
+
+        :param path: (str) .json log to write, None to only print the table
+        :param file: (file) where to print the table, standard output by default
+        """
+        if not self.stages:
+            return
+        summary = self.summary()
+        summary['rows'] = summary['rows'].astype('float64')  # na_rep is not applied to Int64 <NA>
+        width = summary['name'].str.len().max()
+        table = summary.to_string(index=False, float_format='{:.3f}'.format, na_rep='', justify='left',
+                                  formatters={'name': '{{:<{}}}'.format(width).format,  # keeps nested stages indented
+                                              'rows': '{:.0f}'.format})
+        print('Run profile ({:.3f} s since profiling started):\n{}'.format(time.perf_counter() - self._started, table),
+              file=file)
+        if path is not None:
+            print('Run profile saved to ' + self.save(path), file=file)
+
+
+class _StageContext:
+    """ Measures a Stage between __enter__ and __exit__ and adds it to the profiler's stages. """
+
+    def __init__(self, profiler, stage, profile):
+        self.profiler = profiler
+        self.stage = stage
+        self.profile = profile
+
+    def __enter__(self):
+        profiler, stage = self.profiler, self.stage
+        profiler._stack.append(stage)
+        if profiler.memory and tracemalloc.is_tracing():
+            self.memory_start = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, 'reset_peak'):  # python 3.9+, before that the peak is the run's peak so far
+                tracemalloc.reset_peak()
+        self.rss_start = max_rss_mb()
+        stage.start = time.perf_counter() - profiler._started
+        self.cpu_start = time.process_time()
+        self.wall_start = time.perf_counter()
+        if self.profile is not None:
+            self.profile.enable()
+        return stage
+
+    def __exit__(self, exc_type, exc, tb):
+        profiler, stage = self.profiler, self.stage
+        if self.profile is not None:
+            self.profile.disable()
+            profiler._cprofile_active = False
+            stage.profile = profiler._profile_path(stage.name)
+            self.profile.dump_stats(stage.profile)  # view with python -m pstats <stage>.prof, or snakeviz
+        stage.wall_s = time.perf_counter() - self.wall_start
+        stage.cpu_s = time.process_time() - self.cpu_start
+        if self.rss_start is not None:
+            stage.rss_growth_mb = max_rss_mb() - self.rss_start
+        profiler._stack.pop()
+        if profiler.memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, stage.child_peak)  # nested stages reset the peak, so keep the highest they saw
+            stage.memory_delta_mb = (current - self.memory_start) / 1024 ** 2
+            stage.memory_peak_mb = (peak - self.memory_start) / 1024 ** 2
+            if profiler._stack:
+                profiler._stack[-1].child_peak = max(profiler._stack[-1].child_peak, peak)
+        profiler.stages.append(stage)
+        return False
+
+
+PROFILER = Profiler()  # the run's profiler, used by stage() and profiled()
+
+
+def start_profiling(memory=False, cprofile=False, profile_dir=None):
+    """ Starts recording the stages of the run, see Profiler.start() for the options.
+
+    :return: Profiler, call its report() at the end of the run.
+    """
+    PROFILER.start(memory, cprofile, profile_dir)
+    return PROFILER
+
+
+def stage(name, rows=None):
+    """ Context manager measuring a block of code as a stage of the run, see Profiler.stage(). """
+    return PROFILER.stage(name, rows)
+
+
+def profiled(name=None, rows=None):
+    """ Decorator measuring each call of a function as a stage of the run.
+
+    :param name: (str) name of the stage, the function name by default
+    :param rows: (function) rows(result, *args, **kwargs) giving the number of rows processed, by default the length of
+                 the table or array the function returns (see count_rows())
+    """
+    def decorator(function):
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            with PROFILER.stage(stage_name) as measured:
+                result = function(*args, **kwargs)
+                measured.rows = count_rows(result) if rows is None else rows(result, *args, **kwargs)
+            return result
+        return wrapper
+    return decorator
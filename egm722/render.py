@@ -0,0 +1,305 @@
+# Population maps of the UK counties/unitary authorities: single year and population change choropleths, and an atlas
+# of many years/year pairs rendered in parallel worker processes that each hold the geometry loaded once.
+
+import argparse
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cartopy.crs as ccrs
+import matplotlib
+import matplotlib.patches as mpatches
+import matplotlib.pyplot as plt
+import pandas as pd
+from cartopy.feature import ShapelyFeature
+from mpl_toolkits.axes_grid1 import make_axes_locatable
+
+from egm722.cube import COUNTIES_UA_ID, COUNTIES_UA_SHP, OUTPUT_DIR, PopulationCube, parse_year_pairs
+from egm722.export import change_map_path, year_map_path
+from egm722.geometry import for_dpi, load_geometry
+from egm722.profiling import profiled
+
+myCRS = ccrs.OSGB()  # crs that matches the figures epsg 27700, if using other data modify this.
+DROP_COLUMNS = ['CTYUA20NMW', 'BNG_E', 'BNG_N', 'LONG', 'LAT']  # unwanted shapefile columns, modify for own data
+
+_worker_population = None  # counties/UA population GeoDataFrame held by each atlas worker process
+
+
+def generate_handles(labels, colors, edge='k', alpha=1):
+    """Generates matplotlib handles to create a legend of mapped features.
+
+    :param labels: (str) colour names
+    :param colors: (str) colour codes
+    :param edge: (str) outline colour on individual items in legend, set to black
+    :param alpha: (int) image transparency, set to 1
+
+    :return: output: Legend items for figures,example legend entry for outlines for geographic zones.
+    """
+    lc = len(colors)  # generates the length of the color list
+    handles = []
+    for i in range(len(labels)):
+        handles.append(mpatches.Rectangle((0, 0), 1, 1, facecolor=colors[i % lc], edgecolor=edge, alpha=alpha))
+    return handles
+
+
+def scale_bar(ax, location=(0.92, 0.95)):
+    """ Adds a scale bar to the upper right corner of the map.
+
+    :param ax: (str) define axes to determine the scale bar
+    :param location: (int) centre location of scale bar
+
+    :return: output: Scale-bar in the upper right corner of the map figure.
+    """
+    llx0, llx1, lly0, lly1 = ax.get_extent(ccrs.PlateCarree())
+    sbllx = (llx1 + llx0) / 2
+    sblly = lly0 + (lly1 - lly0) * location[1]
+
+    tmc = ccrs.TransverseMercator(sbllx, sblly)
+    x0, x1, y0, y1 = ax.get_extent(tmc)
+    sbx = x0 + (x1 - x0) * location[0]
+    sby = y0 + (y1 - y0) * location[1]
+
+    ax.plot([sbx, sbx - 50000], [sby, sby], color='k', linewidth=5, transform=tmc)
+
+    ax.text(sbx-40000, sby- -10000, '50km', transform=tmc, fontsize=6)
+
+
+@profiled()
+def counties_UA_population_frame(counties_UA, cube, counties_UA_id=COUNTIES_UA_ID):
+    """ Merges the population cube with the counties/UA shapefile to add geometry data to create year maps.
+
+    :param counties_UA: (GeoDataFrame) counties/unitary authority polygons
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param counties_UA_id: (str) column containing counties/unitary authority unique ID
+
+    :return: GeoDataFrame of the counties/UA polygons with their country and a population column for every year.
+    """
+    counties_UA_population = pd.merge(counties_UA, cube.to_frame(), on=counties_UA_id, how='left')
+    return counties_UA_population.drop(columns=[col for col in DROP_COLUMNS if col in counties_UA_population])
+
+
+def population_map(counties_UA_population, column, title, cmap, vmin, vmax, label):
+    """ Creates a choropleth map of a population column for the counties/unitary authorities.
+
+    :param counties_UA_population: (GeoDataFrame) counties/UA polygons with population columns, in epsg 27700
+    :param column: (str or Series) column to map, or values in the row order of counties_UA_population
+    :param title: (str) figure title
+    :param cmap: (str) matplotlib colour map
+    :param vmin: (float) lowest value of the colour scale
+    :param vmax: (float) highest value of the colour scale
+    :param label: (str) colour bar label
+
+    :return: the matplotlib figure of the map.
+    """
+    # create a figure of size 10x10 (representing the page size in inches)
+    fig = plt.figure(figsize=(10, 10))
+
+    # create an axes object in the figure, using OSGB projection to plot data
+    ax = plt.axes(projection=myCRS)
+
+    # adds a colorbar to the map
+    divider = make_axes_locatable(ax)
+    cax = divider.append_axes("right", size="5%", pad=0.1, axes_class=plt.Axes)
+
+    # plot the counties and unitary authority population data into our axis
+    counties_UA_population.plot(column=column, ax=ax, vmin=vmin, vmax=vmax, cmap=cmap, legend=True, cax=cax,
+                                legend_kwds={'label': label, 'orientation': 'vertical'})
+
+    # add counties_UA boundaries
+    counties_UA_outline = ShapelyFeature(counties_UA_population['geometry'], myCRS, edgecolor='k', facecolor='none',
+                                         linewidth=0.2)
+    ax.add_feature(counties_UA_outline)
+
+    xmin, ymin, xmax, ymax = counties_UA_population.total_bounds
+    ax.set_extent([xmin, xmax, ymin, ymax], crs=myCRS)
+
+    # add items for legend
+    county_handles = generate_handles([''], ['none'], edge='k')
+    ax.legend(county_handles, ['Counties/Unitary Authorities'], fontsize=8, loc='upper left', framealpha=1)
+
+    # add gridlines to figure
+    gridlines = ax.gridlines(draw_labels=True,
+                             xlocs=[-8, -6, -4, -2, 0, +2],
+                             ylocs=[52, 54, 56, 58, 60])
+    gridlines.right_labels = False
+    gridlines.bottom_labels = False
+
+    ax.set_title(title, fontdict={'fontsize': '12', 'fontweight': '5'})
+
+    scale_bar(ax)
+    return fig
+
+
+def year_map(counties_UA_population, select_year):
+    """ Map of the county/UA population for a given year, on a fixed colour scale so years can be compared.
+
+    :param counties_UA_population: (GeoDataFrame) counties/UA polygons with population columns, in epsg 27700
+    :param select_year: (str) input year within dataset to map
+
+    :return: the matplotlib figure of the map.
+    """
+    select_year = str(select_year)
+    return population_map(counties_UA_population, select_year, '' + select_year + ' UK Population', 'PuRd',
+                          -1800, 1600000, 'Population, in millions')
+
+
+def change_map(counties_UA_population, select_year, select_year1):
+    """ Map of the county/UA population change (growth or loss) between two years.
+
+    :param counties_UA_population: (GeoDataFrame) counties/UA polygons with population columns, in epsg 27700
+    :param select_year: (str) input year within dataset to start calculation
+    :param select_year1: (str) input year within dataset to end calculation
+
+    :return: the matplotlib figure of the map.
+    """
+    select_year, select_year1 = str(select_year), str(select_year1)
+    population_change = counties_UA_population[select_year1] - counties_UA_population[select_year]
+    return population_map(counties_UA_population, population_change.astype('float64'),
+                          'Population change from ' + select_year + ' to ' + select_year1, 'rainbow',
+                          population_change.min(), population_change.max(), 'Population change')
+
+
+def country_pie(sum_country_total, select_year):
+    """ Pie-chart of each country's share of the UK population for a given year.
+
+    :param sum_country_total: (Series) country total population for the year, indexed by country name, e.g. from
+                              PopulationCube.country_all_year()
+    :param select_year: (str) year of the totals
+
+    :return: the matplotlib figure of the pie-chart.
+    """
+    fig_pie = plt.figure(figsize=(20, 20))
+    ax1 = plt.subplot(121, aspect='equal')
+    sum_country_total.plot(kind='pie', y=str(select_year), ax=ax1, autopct='%1.1f%%', startangle=90,
+                           shadow=False, labels=list(sum_country_total.index), legend=True, fontsize=10)
+    return fig_pie
+
+
+def _init_worker(counties_UA_population):
+    """ Keeps the counties/UA population GeoDataFrame in the worker process for every map it renders. """
+    global _worker_population
+    matplotlib.use('Agg')  # workers render straight to file, no display
+    _worker_population = counties_UA_population
+
+
+def _render_task(task):
+    """ Renders one map in a worker process, task is ('year', year, path, dpi) or ('change', (year, year1), path, dpi).
+    Returns the path of the saved figure, or the PNG image as bytes if path is None.
+    """
+    kind, years, path, dpi = task
+    if kind == 'year':
+        fig = year_map(_worker_population, years)
+    else:
+        fig = change_map(_worker_population, *years)
+    target = io.BytesIO() if path is None else path
+    fig.savefig(target, format='png', dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+    return target.getvalue() if path is None else path
+
+
+@profiled(rows=lambda paths, *args, **kwargs: len(paths['year']) + len(paths['change']))
+def render_atlas(counties_UA_population, years=(), year_pairs=(), output_dir=OUTPUT_DIR, dpi=300, workers=None):
+    """ Renders year maps and population change maps for many years at once across a pool of worker processes.
+
+    The counties/UA population GeoDataFrame is sent to each worker once, when the worker starts, and reused for
+    every map that worker renders. If it was loaded through the geometry cache only the geometry simplified for the
+    dpi is sent.
+
+    :param counties_UA_population: (GeoDataFrame) counties/UA polygons with population columns, in epsg 27700
+    :param years: (list) years to render a year map for
+    :param year_pairs: (list) (start year, end year) pairs to render a population change map for
+    :param output_dir: (str) folder to save the maps into
+    :param dpi: (int) resolution of the saved maps
+    :param workers: (int) number of worker processes, defaults to the number of CPUs
+
+    :return: dict with keys 'year' and 'change' listing the saved map paths in the order of years and year_pairs.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [('year', str(yr), year_map_path(output_dir, yr), dpi) for yr in years]
+    tasks += [('change', (str(yr), str(yr1)), change_map_path(output_dir, yr, yr1), dpi) for yr, yr1 in year_pairs]
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(for_dpi(counties_UA_population, dpi),)) as pool:
+        paths = list(pool.map(_render_task, tasks))
+    return {'year': paths[:len(years)], 'change': paths[len(years):]}
+
+
+def animate_maps(paths, output_path, fps=2):
+    """ Combines saved maps into an animated time series, a GIF or (if ffmpeg is installed) an MP4.
+
+    :param paths: (list) paths of the map images, in the order they should play
+    :param output_path: (str) path of the animation, the file extension .gif or .mp4 selects the format
+    :param fps: (int) frames (maps) per second
+
+    :return: output_path
+    """
+    if not paths:
+        raise ValueError('No maps to animate.')
+    if output_path.lower().endswith('.gif'):
+        from PIL import Image  # installed with matplotlib
+        frames = [Image.open(path).convert('RGB') for path in paths]
+        size = frames[0].size
+        frames = [frame if frame.size == size else frame.resize(size) for frame in frames]
+        frames[0].save(output_path, save_all=True, append_images=frames[1:], duration=int(1000 / fps), loop=0)
+        return output_path
+
+    from matplotlib.animation import FFMpegWriter
+    first = plt.imread(paths[0])
+    fig = plt.figure(figsize=(first.shape[1] / 100, first.shape[0] / 100), dpi=100)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.axis('off')
+    image = ax.imshow(first)
+    writer = FFMpegWriter(fps=fps)
+    with writer.saving(fig, output_path, dpi=100):
+        for path in paths:
+            image.set_data(plt.imread(path))
+            writer.grab_frame()
+    plt.close(fig)
+    return output_path
+
+
+def parse_years(text):
+    """ Reads a year list such as '1991-2019' or '2002,2010,2019' into a list of years (int). """
+    years = []
+    for part in text.split(','):
+        if '-' in part:
+            start, end = part.split('-')
+            years.extend(range(int(start), int(end) + 1))
+        elif part.strip():
+            years.append(int(part))
+    return years
+
+
+def main(argv=None):
+    """ Renders a population atlas from the command line, e.g. python -m egm722.render --years 1991-2019 --animate gif """
+    parser = argparse.ArgumentParser(description='Render UK population maps for many years in parallel.')
+    parser.add_argument('--years', type=parse_years, default=[], help="years to map, e.g. '1991-2019'")
+    parser.add_argument('--pairs', type=parse_year_pairs, default=[],
+                        help="population change periods, e.g. '1991:2019,2002:2019'")
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help='folder to save the maps into')
+    parser.add_argument('--dpi', type=int, default=300, help='resolution of the saved maps')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to the CPU count')
+    parser.add_argument('--animate', choices=['gif', 'mp4'], help='also combine the year maps into an animation')
+    parser.add_argument('--fps', type=int, default=2, help='animation frames per second')
+    args = parser.parse_args(argv)
+
+    cube = PopulationCube.from_files()
+    years = args.years or ([] if args.pairs else list(cube.years))
+    try:
+        for year in years + [year for pair in args.pairs for year in pair]:
+            cube.year_position(year)  # before the workers start, rather than a KeyError inside one
+    except KeyError as e:
+        parser.error(e.args[0])
+    counties_UA_population = counties_UA_population_frame(load_geometry(COUNTIES_UA_SHP), cube)
+    saved = render_atlas(counties_UA_population, years, args.pairs, args.output_dir, args.dpi, args.workers)
+    for path in saved['year'] + saved['change']:
+        print(path)
+    if args.animate and saved['year']:
+        animation = os.path.join(args.output_dir, 'UK population_{}_{}.{}'.format(min(years), max(years),
+                                                                                 args.animate))
+        print(animate_maps(saved['year'], animation, args.fps))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+# Scenario batches: many what-if selections (years, change windows, counties/UA and countries) answered in one run.
+# The data is loaded and joined once, every year, county/UA, country and change window used by the batch is computed
+# once with array operations over all the scenarios, and maps are rendered once per year/window across worker
+# processes. The run writes one results table with a row per scenario and a folder of tables for each scenario.
+#
+# A scenario file (.yaml or .json) is a list of scenarios, or a dict with 'defaults' applied to every scenario and the
+# 'scenarios' list. Scenario keys are the script's input variables, a list of values makes a scenario for each value:
+#
+#   defaults: {select_year: 2002, select_year1: 2019}
+#   scenarios:
+#     - {name: conwy, select_county_UA: Conwy, select_country: Wales}
+#     - {select_county_UA: [Cardiff, Swansea], select_country: Wales, select_year: [1991, 2002], maps: true}
+#
+#   python -m egm722.scenarios scenarios.yaml --output-dir outputs
+
+import argparse
+import itertools
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from egm722.cube import COUNTIES_UA_SHP, COUNTRIES_SHP, OUTPUT_DIR, POPULATION_CSV, PopulationCube
+from egm722.export import OutputBatch
+from egm722.profiling import profiled
+from egm722.timeseries import trend_summary
+
+SCENARIO_KEYS = ('name', 'select_year', 'select_year1', 'select_county_UA', 'select_country', 'maps')
+RESULTS_NAME = 'scenario_results'
+
+
+def read_scenarios(path):
+    """ Reads a scenario file, YAML (.yaml/.yml, needs pyyaml) or JSON.
+
+    :param path: (str) scenario file
+
+    :return: list of scenario dicts, see expand_scenarios().
+    """
+    with open(path) as f:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            import yaml  # only needed for YAML scenario files
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    return expand_scenarios(spec)
+
+
+def expand_scenarios(spec):
+    """ Applies the defaults and expands list values into one scenario per value (every combination of the lists).
+
+    :param spec: (list or dict) list of scenario dicts, or a dict with 'defaults' and 'scenarios'
+
+    :return: list of scenario dicts with the SCENARIO_KEYS, each with a unique name.
+    """
+    defaults, scenarios = ({}, spec) if isinstance(spec, list) else (spec.get('defaults', {}), spec['scenarios'])
+    expanded = []
+    for number, scenario in enumerate(scenarios, 1):
+        scenario = dict(defaults, **scenario)
+        unknown = [key for key in scenario if key not in SCENARIO_KEYS]
+        if unknown:
+            raise ValueError('Scenario {} has unknown keys {}, use {}.'.format(number, unknown, SCENARIO_KEYS))
+        lists = [key for key in SCENARIO_KEYS[1:5] if isinstance(scenario.get(key), list)]
+        for values in itertools.product(*[scenario[key] for key in lists]):
+            single = dict(scenario, **dict(zip(lists, values)))
+            parts = [str(single[key]) for key in SCENARIO_KEYS[1:5] if single.get(key) is not None]
+            if 'name' not in scenario:
+                single['name'] = '_'.join(parts) or 'scenario_{}'.format(number)
+            elif lists:
+                single['name'] = '_'.join([scenario['name']] + [str(value) for value in values])
+            expanded.append({key: single.get(key) for key in SCENARIO_KEYS})
+
+    seen = {}
+    for scenario in expanded:  # scenario names are folder names, so they must be unique
+        name = re.sub(r'[^\w.-]+', '_', str(scenario['name'])).strip('_') or 'scenario'
+        seen[name] = seen.get(name, 0) + 1
+        scenario['name'] = name if seen[name] == 1 else '{}_{}'.format(name, seen[name])
+    return expanded
+
+
+def _positions(cube, scenarios):
+    """ Cube positions of each scenario's selections, -1 where not selected, and an error message for scenarios that
+    select something not in the data. select_year1 the same as select_year is no change window (as in years_check()).
+    """
+    n = len(scenarios)
+    year, year1, county, country = (np.full(n, -1) for _ in range(4))
+    errors = [None] * n
+    for i, scenario in enumerate(scenarios):
+        try:
+            if scenario['select_year'] is not None:
+                year[i] = cube.year_position(scenario['select_year'])
+            if scenario['select_year1'] is not None:
+                year1[i] = cube.year_position(scenario['select_year1'])
+                if year[i] < 0:
+                    raise ValueError('select_year1 needs a select_year.')
+                if cube.years[year1[i]] < cube.years[year[i]]:
+                    raise ValueError('select_year1 must be after select_year.')
+                if year1[i] == year[i]:
+                    year1[i] = -1
+            if scenario['maps'] and year[i] < 0:
+                raise ValueError('maps needs a select_year to map.')
+            if scenario['select_county_UA'] is not None:
+                county[i] = cube.county_position(scenario['select_county_UA'])
+            if scenario['select_country'] is not None:
+                country[i] = cube.country_position(scenario['select_country'])
+        except (KeyError, ValueError) as err:
+            errors[i] = str(err.args[0])
+    return year, year1, county, country, errors
+
+
+def _has_window(scenario):
+    """ True if a valid scenario has a change window, a select_year1 after its select_year. """
+    return scenario['select_year1'] is not None and int(scenario['select_year1']) != int(scenario['select_year'])
+
+
+def _group_sums(values, codes, n_groups):
+    """ Sum of the rows of values in each group (rows with code -1 left out), NaN where no row has data. """
+    assigned = codes >= 0
+    sums = np.zeros((n_groups,) + values.shape[1:])
+    counts = np.zeros((n_groups,) + values.shape[1:])
+    np.add.at(sums, codes[assigned], np.nan_to_num(values[assigned]))
+    np.add.at(counts, codes[assigned], ~np.isnan(values[assigned]))
+    return np.where(counts > 0, sums, np.nan)
+
+
+def _take(array, *positions):
+    """ array[positions] for each scenario, NaN where any position is -1 (nothing selected or an invalid scenario). """
+    selected = np.all([pos >= 0 for pos in positions], axis=0)
+    values = np.full(len(positions[0]), np.nan)
+    values[selected] = array[tuple(pos[selected] for pos in positions)]
+    return values
+
+
+@profiled(rows=lambda results, *args, **kwargs: len(results))
+def evaluate_scenarios(cube, scenarios):
+    """ Answers every scenario of a batch at once.
+
+    Each year, county/UA, country and change window is computed once however many scenarios use it: year statistics
+    and ranks for the distinct years, population change of every county/UA for the distinct change windows, and the
+    scenario values picked out of those arrays by position.
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param scenarios: (list) scenario dicts, from expand_scenarios()
+
+    :return: DataFrame with a row per scenario: the selections, UK, county/UA and country population for select_year,
+             and for change windows (select_year1) the change and CAGR of the county/UA, country and UK and the
+             counties/UA with the largest growth and loss. 'error' explains scenarios that could not be answered.
+    """
+    year, year1, county, country, errors = _positions(cube, scenarios)
+    valid = np.array([error is None for error in errors])
+    year, year1, county, country = (np.where(valid, pos, -1) for pos in (year, year1, county, country))
+
+    # year statistics and county/UA ranks, once for each distinct year
+    uk_codes = np.zeros(len(cube.ids), dtype='int64')  # every county/UA is in the UK
+    years = np.unique(np.r_[year, year1][np.r_[year, year1] >= 0])
+    columns = cube.values[:, years]
+    with np.errstate(invalid='ignore'):
+        statistics = np.full((4, len(cube.years)), np.nan)
+        if len(years):
+            statistics[:, years] = [np.nanmean(columns, axis=0), np.nanmax(columns, axis=0),
+                                    np.nanmin(columns, axis=0), _group_sums(columns, uk_codes, 1)[0]]
+    # country totals, NaN rather than 0 where no county/UA of the country has data (e.g. Northern Ireland 1991-2000)
+    country_totals = _group_sums(cube.values, cube.country_codes, len(cube.country_names))
+    ranks = np.full(cube.values.shape, np.nan)
+    ranks[:, years] = pd.DataFrame(columns).rank(ascending=False, method='min').to_numpy()
+
+    # population change of every county/UA, once for each distinct change window
+    windows = sorted({(a, b) for a, b in zip(year, year1) if b >= 0})
+    window_index = {window: k for k, window in enumerate(windows)}
+    window = np.array([window_index.get((a, b), -1) for a, b in zip(year, year1)])
+    start, end = (np.array([w[i] for w in windows], dtype='int64') for i in (0, 1))
+    change = cube.values[:, end] - cube.values[:, start] if windows else np.empty((len(cube.ids), 0))
+    largest = np.full((2, len(windows)), -1)  # rows of the largest growth and largest loss in each window
+    has_change = ~np.all(np.isnan(change), axis=0)
+    largest[0, has_change] = np.nanargmax(change[:, has_change], axis=0)
+    largest[1, has_change] = np.nanargmin(change[:, has_change], axis=0)
+    largest_change = np.where(largest >= 0, change[np.maximum(largest, 0), np.arange(len(windows))], np.nan)
+
+    # country and UK totals of each window over the counties/UA with data in both years, so data starting or stopping
+    # in the window is not counted as growth or loss
+    both = ~np.isnan(change)
+    window_start, window_end = (np.where(both, cube.values[:, ends], np.nan) for ends in (start, end))
+    country_window = [_group_sums(values, cube.country_codes, len(cube.country_names))
+                      for values in (window_start, window_end)]
+    uk_window = [_group_sums(values, uk_codes, 1)[0] for values in (window_start, window_end)]
+
+    span = np.where(year1 >= 0, cube.years[year1] - cube.years[np.maximum(year, 0)], 0)
+    county_start, county_end = _take(cube.values, county, year), _take(cube.values, county, year1)
+    country_start, country_end = _take(country_totals, country, year), _take(country_totals, country, year1)
+    uk_start, uk_end = _take(statistics[3], year), _take(statistics[3], year1)
+    country_both = [_take(values, country, window) for values in country_window]
+    uk_both = [_take(values, window) for values in uk_window]
+
+    def largest_name(k):
+        rows = np.where(window >= 0, largest[k][np.maximum(window, 0)] if windows else -1, -1)
+        return [cube.names[row] if row >= 0 else None for row in rows]
+
+    def cagr(first, last):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(span > 0, (last / first) ** (1 / np.maximum(span, 1)) - 1, np.nan)
+
+    def selection(key):
+        return pd.Series([scenario[key] for scenario in scenarios], dtype=object)  # as given, years stay whole numbers
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        results = pd.DataFrame({
+            'scenario': [scenario['name'] for scenario in scenarios], 'select_year': selection('select_year'),
+            'select_year1': selection('select_year1'), 'select_county_UA': selection('select_county_UA'),
+            'select_country': selection('select_country'),
+            'uk_population': uk_start, 'ua_mean': _take(statistics[0], year), 'ua_max': _take(statistics[1], year),
+            'ua_min': _take(statistics[2], year), 'county_population': county_start,
+            'county_rank': _take(ranks, county, year), 'country_population': country_start,
+            'country_share': country_start / uk_start, 'county_population1': county_end,
+            'county_change': county_end - county_start, 'county_cagr': cagr(county_start, county_end),
+            'country_population1': country_end, 'country_change': country_both[1] - country_both[0],
+            'country_cagr': cagr(*country_both), 'uk_population1': uk_end, 'uk_change': uk_both[1] - uk_both[0],
+            'uk_cagr': cagr(*uk_both), 'largest_growth_UA': largest_name(0),
+            'largest_growth': _take(largest_change[0], window), 'largest_loss_UA': largest_name(1),
+            'largest_loss': _take(largest_change[1], window), 'error': pd.Series(errors, dtype=object)})
+    for col in results.columns[5:-1]:
+        values = results[col]
+        if values.dtype == 'float64' and np.array_equal(values.dropna(), np.round(values.dropna())):
+            results[col] = values.astype('Int64')  # counts and ranks are written as whole numbers, as in to_frame()
+    return results
+
+
+def scenario_tables(cube, scenario, cache):
+    """ Tables of a scenario, as the script writes them for its selections. Tables shared by several scenarios (the
+    same year, county/UA, country or change window) are made once and kept in cache.
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param scenario: (dict) scenario, from expand_scenarios()
+    :param cache: (dict) tables made for earlier scenarios of the batch
+
+    :return: dict of table name -> DataFrame.
+    """
+    def cached(key, make):
+        if key not in cache:
+            cache[key] = make()
+        return cache[key]
+
+    tables = {}
+    select_year, select_year1 = scenario['select_year'], scenario['select_year1']
+    if select_year is not None:
+        select_year = str(int(select_year))
+        tables['{}_{}'.format(cube.counties_UA_id, select_year)] = cached(('year', select_year), lambda: cube.to_frame(
+            years=[select_year])[[cube.counties_UA_name, cube.counties_UA_id, select_year]].sort_values(
+            [select_year], ascending=[False]))
+    if scenario['select_county_UA'] is not None:
+        row = cube.county_position(scenario['select_county_UA'])
+        tables['counties_UA_name_{}'.format(cube.names[row])] = cached(('county', row),
+                                                                       lambda: cube.to_frame(rows=[row]))
+    if scenario['select_country'] is not None:
+        name = cube.country_names[cube.country_position(scenario['select_country'])]
+        tables['country_{}_population'.format(name)] = cached(('country', name), lambda: cube.to_frame(
+            rows=cube.country_rows[name]))
+    if _has_window(scenario):
+        select_year1 = str(int(select_year1))
+        tables['population_trends_{}_{}'.format(select_year, select_year1)] = cached(
+            ('window', select_year, select_year1), lambda: trend_summary(cube, select_year, select_year1))
+    return tables
+
+
+def render_scenario_maps(cube, scenarios, results, counties_UA_shp, maps_dir, dpi=300, workers=None):
+    """ Renders the year and change maps of the scenarios with maps: true, each distinct map once, across a pool of
+    worker processes (see egm722.render.render_atlas()). Adds 'year_map' and 'change_map' path columns to results.
+    """
+    from egm722 import render
+    from egm722.export import change_map_path, year_map_path
+    from egm722.geometry import load_geometry
+
+    mapped = [i for i, scenario in enumerate(scenarios) if scenario['maps'] and scenario['select_year'] is not None
+              and pd.isna(results['error'][i])]
+    years = sorted({int(scenarios[i]['select_year']) for i in mapped})
+    pairs = sorted({(int(scenarios[i]['select_year']), int(scenarios[i]['select_year1'])) for i in mapped
+                    if _has_window(scenarios[i])})
+    results['year_map'] = None
+    results['change_map'] = None
+    if not years and not pairs:
+        return results
+    counties_UA_population = render.counties_UA_population_frame(load_geometry(counties_UA_shp), cube)
+    render.render_atlas(counties_UA_population, years, pairs, maps_dir, dpi, workers)
+    for i in mapped:
+        scenario = scenarios[i]
+        results.loc[i, 'year_map'] = year_map_path(maps_dir, int(scenario['select_year']))
+        if _has_window(scenario):
+            results.loc[i, 'change_map'] = change_map_path(maps_dir, int(scenario['select_year']),
+                                                           int(scenario['select_year1']))
+    return results
+
+
+def run_scenarios(scenarios, population_csv=POPULATION_CSV, counties_UA_shp=COUNTIES_UA_SHP,
+                  countries_shp=COUNTRIES_SHP, output_dir=OUTPUT_DIR, fmt='csv', dpi=300, workers=None):
+    """ Runs a scenario batch: loads the data once, answers every scenario and writes the results.
+
+    Written to output_dir: scenario_results.<fmt> (a row per scenario, see evaluate_scenarios()), a scenarios/<name>
+    folder for each scenario with its tables (see scenario_tables()) and a scenario.json of its selections and
+    results, and the maps of scenarios with maps: true in scenarios/maps.
+
+    :param scenarios: (str or list) scenario file, or a list of scenario dicts / the contents of a scenario file
+    :param population_csv: (str) population table
+    :param counties_UA_shp: (str) counties/unitary authority shapefile
+    :param countries_shp: (str) country shapefile
+    :param output_dir: (str) output folder
+    :param fmt: (str) table format, 'csv', 'parquet' or 'feather'
+    :param dpi: (int) resolution of the maps
+    :param workers: (int) number of map rendering processes, defaults to the number of CPUs
+
+    :return: DataFrame of the scenario results.
+    """
+    scenarios = read_scenarios(scenarios) if isinstance(scenarios, str) else expand_scenarios(scenarios)
+    cube = PopulationCube.from_files(population_csv, counties_UA_shp, countries_shp)
+    results = evaluate_scenarios(cube, scenarios)
+    scenario_dir = os.path.join(output_dir, 'scenarios')
+    results = render_scenario_maps(cube, scenarios, results, counties_UA_shp, os.path.join(scenario_dir, 'maps'), dpi,
+                                   workers)
+
+    cache = {}
+    for i, scenario in enumerate(scenarios):
+        folder = os.path.join(scenario_dir, scenario['name'])
+        with OutputBatch(folder, fmt) as outputs:
+            if pd.isna(results['error'][i]):
+                for name, table in scenario_tables(cube, scenario, cache).items():
+                    outputs.add(table, name)
+        record = {key: (None if pd.isna(value) else value.item() if hasattr(value, 'item') else value)
+                  for key, value in results.iloc[i].items()}
+        with open(os.path.join(folder, 'scenario.json'), 'w') as f:
+            json.dump({'scenario': scenario, 'results': record}, f, indent=1)
+    with OutputBatch(output_dir, fmt) as outputs:
+        outputs.add(results, RESULTS_NAME)
+    return results
+
+
+def main(argv=None):
+    """ Runs a scenario file from the command line, e.g. python -m egm722.scenarios scenarios.yaml """
+    parser = argparse.ArgumentParser(description='Answer a batch of population scenarios in one run.')
+    parser.add_argument('scenarios', help='scenario file, .yaml or .json')
+    parser.add_argument('--population-csv', default=POPULATION_CSV, help='population table')
+    parser.add_argument('--counties-shp', default=COUNTIES_UA_SHP, help='counties/unitary authority shapefile')
+    parser.add_argument('--countries-shp', default=COUNTRIES_SHP, help='country shapefile')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help='output folder')
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet', 'feather'], help='table format')
+    parser.add_argument('--dpi', type=int, default=300, help='resolution of the maps')
+    parser.add_argument('--workers', type=int, default=None, help='map rendering processes')
+    args = parser.parse_args(argv)
+
+    results = run_scenarios(args.scenarios, args.population_csv, args.counties_shp, args.countries_shp,
+                            args.output_dir, args.format, args.dpi, args.workers)
+    print('{} scenarios, results in {}'.format(len(results), os.path.join(args.output_dir, RESULTS_NAME)))
+    for _, row in results[results['error'].notna()].iterrows():
+        print('  {}: {}'.format(row['scenario'], row['error']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+# Population query service: a small asyncio HTTP server that keeps the population cube in memory and answers the
+# script's queries (year statistics, county/UA, country, all countries, population change and maps) as JSON or PNG.
+#
+#   python -m egm722.server --port 8722
+#   curl "http://127.0.0.1:8722/country?country=England&year=2006"
+
+import argparse
+import asyncio
+import json
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+import pandas as pd
+
+from egm722.cube import COUNTIES_UA_SHP, PopulationCube
+
+STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+def _records(table):
+    """ Rows of a DataFrame as a list of dicts, with nodata as None so they can be written as JSON. """
+    return [{key: _value(value) for key, value in row.items()} for row in table.to_dict(orient='records')]
+
+
+def _value(value):
+    """ Converts numpy/pandas scalars to JSON values, NaN and <NA> to None. """
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+
+class ResponseCache:
+    """ Least recently used cache of response bodies, keyed by request path and query. """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, response):
+        self.entries[key] = response
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class PopulationService:
+    """ Answers population queries from a PopulationCube held in memory.
+
+    Each query method takes the request's query parameters (dict of str) and returns a JSON-serialisable dict, or
+    raises KeyError (unknown year/county/country, answered 404) or ValueError (bad or missing parameter, answered 400).
+    Maps are rendered in worker processes that load the counties/UA geometry once, the first time a map is requested.
+    """
+
+    def __init__(self, cube, counties_UA_shp=COUNTIES_UA_SHP, map_dpi=100, map_workers=2, cache_size=512):
+        """
+        :param cube: (PopulationCube) population data loaded once from the datasets
+        :param counties_UA_shp: (str) path to the counties/unitary authority shapefile, used for maps
+        :param map_dpi: (int) resolution of the maps
+        :param map_workers: (int) number of map rendering processes
+        :param cache_size: (int) number of responses kept in the response cache
+        """
+        self.cube = cube
+        self.counties_UA_shp = counties_UA_shp
+        self.map_dpi = map_dpi
+        self.map_workers = map_workers
+        self.cache = ResponseCache(cache_size)
+        self.map_pool = None
+        self.render_task = None
+        self._map_pool_lock = None  # created on the event loop, by the first map request
+        self.routes = {'/year': self.year_population,
+                       '/county': self.counties_UA_population_data,
+                       '/country': self.country_year_population,
+                       '/countries': self.country_all_year,
+                       '/change': self.counties_UA_population_change,
+                       '/health': self.health}
+
+    @staticmethod
+    def _param(params, name):
+        if not params.get(name):
+            raise ValueError('missing query parameter: {}'.format(name))
+        return params[name]
+
+    def year_population(self, params):
+        """ /year?year=2002 - summary statistics and counties/UA in descending population order for a year. """
+        select_year = self._param(params, 'year')
+        stats = self.cube.year_statistics(select_year)
+        column = str(int(select_year))
+        table = self.cube.to_frame(years=[column]).sort_values(column, ascending=False)
+        return {'year': int(select_year), 'statistics': {key: _value(value) for key, value in stats.items()},
+                'counties_UA': _records(table)}
+
+    def counties_UA_population_data(self, params):
+        """ /county?name=Conwy - population of a county/UA (name or ID) for every year. """
+        row = self.cube.county_position(self._param(params, 'name'))
+        return _records(self.cube.to_frame(rows=[row]))[0]
+
+    def country_year_population(self, params):
+        """ /country?country=England&year=2006 - country total for a year and its counties/UA for every year. """
+        select_country = self._param(params, 'country')
+        select_year = self._param(params, 'year')
+        return {'country': select_country.title(), 'year': int(select_year),
+                'population': _value(self.cube.country_year(select_country, select_year)),
+                'counties_UA': _records(self.cube.to_frame(rows=self.cube.country_rows_of(select_country)))}
+
+    def country_all_year(self, params):
+        """ /countries?year=2006 - every country's total population for a year, in descending order. """
+        totals = self.cube.country_all_year(self._param(params, 'year')).sort_values(ascending=False)
+        return {'year': int(params['year']), 'countries': {name: _value(value) for name, value in totals.items()}}
+
+    def counties_UA_population_change(self, params):
+        """ /change?start=2002&end=2019 - population change of every county/UA, in descending order. """
+        start, end = self._param(params, 'start'), self._param(params, 'end')
+        table = self.cube.to_frame(years=[start, end])
+        table['Population change'] = self.cube.change(start, end)
+        return {'start': int(start), 'end': int(end),
+                'counties_UA': _records(table.sort_values('Population change', ascending=False))}
+
+    def health(self, params):
+        """ /health - cube size and response cache counters. """
+        return {'cube': repr(self.cube), 'cache_entries': len(self.cache.entries), 'cache_hits': self.cache.hits,
+                'cache_misses': self.cache.misses}
+
+    def _map_task(self, params):
+        """ Render task for /map.png?year=2002 or /map.png?start=2002&end=2019. """
+        if params.get('year'):
+            self.cube.year_position(params['year'])
+            return ('year', str(int(params['year'])), None, self.map_dpi)
+        start, end = self._param(params, 'start'), self._param(params, 'end')
+        self.cube.year_position(start), self.cube.year_position(end)
+        return ('change', (str(int(start)), str(int(end))), None, self.map_dpi)
+
+    def _start_map_pool(self):
+        """ Loads the geometry and starts the map rendering processes, on the first map request. """
+        from egm722 import render  # cartopy and matplotlib are only imported once a map is asked for
+        from egm722.geometry import for_dpi, load_geometry
+        counties_UA_population = render.counties_UA_population_frame(load_geometry(self.counties_UA_shp), self.cube)
+        self.map_pool = ProcessPoolExecutor(max_workers=self.map_workers, initializer=render._init_worker,
+                                            initargs=(for_dpi(counties_UA_population, self.map_dpi),))
+        self.render_task = render._render_task
+
+    async def _ensure_map_pool(self):
+        """ Starts the map pool once, in a thread so JSON queries are still answered while the geometry loads. """
+        if self._map_pool_lock is None:
+            self._map_pool_lock = asyncio.Lock()
+        async with self._map_pool_lock:  # map requests arriving meanwhile wait for the same pool
+            if self.map_pool is None:
+                await asyncio.get_running_loop().run_in_executor(None, self._start_map_pool)
+
+    async def respond(self, target):
+        """ Answers a GET request target (path and query string).
+
+        :return: tuple of (status code, content type, body bytes).
+        """
+        cached = self.cache.get(target)
+        if cached is not None:
+            return cached
+
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        try:
+            if url.path == '/map.png':
+                task = self._map_task(params)
+                await self._ensure_map_pool()
+                body = await asyncio.get_running_loop().run_in_executor(self.map_pool, self.render_task, task)
+                response = (200, 'image/png', body)
+            elif url.path in self.routes:
+                response = (200, 'application/json', json.dumps(self.routes[url.path](params)).encode())
+            else:
+                response = (404, 'application/json',
+                            json.dumps({'error': 'unknown endpoint {}'.format(url.path),
+                                        'endpoints': sorted(self.routes) + ['/map.png']}).encode())
+        except KeyError as e:
+            return 404, 'application/json', json.dumps({'error': str(e.args[0])}).encode()
+        except ValueError as e:
+            return 400, 'application/json', json.dumps({'error': str(e)}).encode()
+
+        if response[0] == 200 and url.path != '/health':
+            self.cache.put(target, response)
+        return response
+
+    async def handle(self, reader, writer):
+        """ Serves HTTP/1.1 GET requests on one connection, keeping it open between requests unless asked not to. """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    status, content_type, body = 400, 'application/json', b'{"error": "malformed request"}'
+                elif parts[0] not in ('GET', 'HEAD'):
+                    status, content_type, body = 405, 'application/json', b'{"error": "only GET is supported"}'
+                else:
+                    try:
+                        status, content_type, body = await self.respond(parts[1])
+                    except Exception as e:  # keep serving other requests
+                        status, content_type = 500, 'application/json'
+                        body = json.dumps({'error': '{}: {}'.format(type(e).__name__, e)}).encode()
+
+                keep_alive = (len(parts) == 3 and parts[2] == 'HTTP/1.1' and
+                              headers.get('connection', '').lower() != 'close')
+                head = ('HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+                    status, STATUS[status], content_type, len(body), 'keep-alive' if keep_alive else 'close'))
+                writer.write(head.encode('latin-1'))
+                if len(parts) != 3 or parts[0] != 'HEAD':
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        if self.map_pool is not None:
+            self.map_pool.shutdown()
+
+
+async def serve(service, host='127.0.0.1', port=8722):
+    """ Runs the population service until cancelled.
+
+    :param service: (PopulationService) service answering the requests
+    :param host: (str) address to listen on
+    :param port: (int) port to listen on
+    """
+    server = await asyncio.start_server(service.handle, host, port)
+    print('Serving UK population queries on http://{}:{}/ ({})'.format(host, port, repr(service.cube)))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    """ Starts the query service from the command line, e.g. python -m egm722.server --port 8722 """
+    parser = argparse.ArgumentParser(description='Serve UK population queries over HTTP from data held in memory.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8722, help='port to listen on')
+    parser.add_argument('--map-dpi', type=int, default=100, help='resolution of /map.png images')
+    parser.add_argument('--map-workers', type=int, default=2, help='map rendering processes')
+    parser.add_argument('--cache-size', type=int, default=512, help='number of responses kept in memory')
+    args = parser.parse_args(argv)
+
+    service = PopulationService(PopulationCube.from_files(), map_dpi=args.map_dpi, map_workers=args.map_workers,
+                                cache_size=args.cache_size)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# Batch population statistics: every year and every grouping level (county/UA, country, UK) in one vectorized pass
+# over the population cube, returned as a single tidy table.
+
+import numpy as np
+import pandas as pd
+
+from egm722.profiling import profiled
+
+LEVELS = ('UA', 'country', 'UK')  # grouping levels, from smallest to largest
+
+
+def _group_reduce(values, groups, n_groups):
+    """ Sum, mean, min, max and count of the rows of values in each group, for every column at once.
+
+    :param values: (array) (rows x years) population array, NaN for nodata
+    :param groups: (array) group number of each row, rows with a negative group are left out
+    :param n_groups: (int) number of groups
+
+    :return: dict of (n_groups x years) arrays with keys 'population', 'mean', 'min', 'max' and 'count'.
+    """
+    keep = groups >= 0
+    order = np.argsort(groups[keep], kind='stable')
+    sorted_groups = groups[keep][order]
+    sorted_values = values[keep][order]
+    starts = np.searchsorted(sorted_groups, np.arange(n_groups))  # first row of each group in the sorted rows
+
+    missing = np.isnan(sorted_values)
+    count = np.add.reduceat(~missing, starts, axis=0).astype('int64')
+    total = np.add.reduceat(np.where(missing, 0, sorted_values), starts, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+    nodata = count == 0
+    return {'population': np.where(nodata, np.nan, total),
+            'mean': np.where(nodata, np.nan, mean),
+            'min': np.fmin.reduceat(sorted_values, starts, axis=0),  # fmin/fmax skip NaN
+            'max': np.fmax.reduceat(sorted_values, starts, axis=0),
+            'count': count}
+
+
+@profiled()
+def batch_statistics(cube, levels=LEVELS):
+    """ Calculates population statistics for every year and grouping level of the population cube.
+
+    For each region (county/UA, country or the UK) and year the table holds the total population, the mean, smallest
+    and largest county/UA population within the region, the number of counties/UA with data, the rank of the region
+    within its level for that year (1 = most populated) and the change and percentage change from the previous year.
+    Regions with no data in a year (e.g. Northern Ireland 1991-2000) have an empty (NaN) population rather than 0, and
+    the change of a region is over its counties/UA with data in both years.
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param levels: (tuple) grouping levels to include, any of 'UA', 'country' and 'UK'
+
+    :return: tidy DataFrame with columns level, region, year, population, mean, min, max, count, rank, change and
+             pct_change, one row per level/region/year. An example row, England in 2006:
+
+               level  region  year  population       mean    min        max  count  rank   change  pct_change
+             country England  2006  50965186.0  337517.79 2264.0  1389634.0    151     1 359152.0    0.709702
+    """
+    unknown = [level for level in levels if level not in LEVELS]
+    if unknown:
+        raise ValueError('{} is not a grouping level, choose from {}.'.format(unknown, LEVELS))
+
+    n_rows = len(cube.ids)
+    groupings = {'UA': (np.arange(n_rows), cube.names),
+                 'country': (cube.country_codes, cube.country_names),
+                 'UK': (np.zeros(n_rows, dtype='int64'), np.asarray(['UK'], dtype=object))}
+
+    tables = []
+    for level in levels:
+        groups, regions = groupings[level]
+        reduced = _group_reduce(cube.values, groups, len(regions))
+        population = reduced['population']
+
+        rank = pd.DataFrame(population).rank(axis=0, ascending=False, method='min').to_numpy()
+        # year-over-year change over the counties/UA with data in both years, so data starting or stopping (e.g.
+        # Northern Ireland from 2001) is not counted as growth or loss. Empty for the first year
+        change = np.full_like(population, np.nan)
+        change[:, 1:] = _group_reduce(cube.values[:, 1:] - cube.values[:, :-1], groups, len(regions))['population']
+        previous = np.where(np.isnan(cube.values[:, 1:]), np.nan, cube.values[:, :-1])
+        pct_change = np.full_like(population, np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            pct_change[:, 1:] = change[:, 1:] / _group_reduce(previous, groups, len(regions))['population'] * 100
+
+        n_regions, n_years = population.shape
+        columns = {'level': np.repeat(level, n_regions * n_years),
+                   'region': np.repeat(regions, n_years),
+                   'year': np.tile(cube.years, n_regions)}
+        for name, array in [('population', population), ('mean', reduced['mean']), ('min', reduced['min']),
+                            ('max', reduced['max']), ('count', reduced['count']), ('rank', rank),
+                            ('change', change), ('pct_change', pct_change)]:
+            columns[name] = array.ravel()  # (region x year) arrays flatten to region-major order
+        tables.append(pd.DataFrame(columns))
+
+    statistics = pd.concat(tables, ignore_index=True)
+    statistics['rank'] = statistics['rank'].astype('Int64')
+    return statistics
+
+
+def select_statistics(statistics, level, select_year=None, region=None):
+    """ Selects rows of the batch statistics table for a level and optionally a year and/or region.
+
+    :param statistics: (DataFrame) table returned by batch_statistics()
+    :param level: (str) grouping level, 'UA', 'country' or 'UK'
+    :param select_year: (str or int) year to select, all years if None
+    :param region: (str) county/UA or country name to select, all regions if None
+
+    :return: DataFrame of the selected rows, in descending population order for a single year.
+    """
+    selected = statistics[statistics['level'] == level]
+    if select_year is not None:
+        selected = selected[selected['year'] == int(select_year)].sort_values('rank')
+    if region is not None:
+        selected = selected[selected['region'].str.lower() == str(region).lower()]
+    return selected
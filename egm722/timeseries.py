@@ -0,0 +1,174 @@
+# Population time-series analytics for every county/unitary authority at once: annual growth rates, compound annual
+# growth (CAGR), rolling means, linear and log-linear trend fits, projections and all pairwise year differences. Each
+# function works on the whole (county/UA x year) array of the population cube with NumPy, nodata (NaN) is skipped.
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from egm722.profiling import profiled
+
+
+def _year_slice(cube, start=None, end=None):
+    """ Column positions of the cube from start to end year (inclusive), the whole data range by default. """
+    first = 0 if start is None else cube.year_position(start)
+    last = len(cube.years) - 1 if end is None else cube.year_position(end)
+    if first > last:
+        raise ValueError('{} is after {}, please provide start year before end year.'.format(start, end))
+    return slice(first, last + 1)
+
+
+def _frame(cube, array, columns):
+    """ (county/UA x column) array as a DataFrame indexed by county/UA ID. """
+    return pd.DataFrame(array, index=pd.Index(cube.ids, name=cube.counties_UA_id), columns=columns)
+
+
+def growth_rates(cube):
+    """ Annual growth rate of every county/UA, (population / previous year's population) - 1.
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+
+    :return: DataFrame indexed by county/UA ID with a column for each year after the first, NaN where either year has
+             no data.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rates = cube.values[:, 1:] / cube.values[:, :-1] - 1
+    return _frame(cube, rates, [str(yr) for yr in cube.years[1:]])
+
+
+def cagr(cube, select_year, select_year1):
+    """ Compound annual growth rate of every county/UA between two years, (end / start) ** (1 / years) - 1.
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param select_year: (str or int) start year
+    :param select_year1: (str or int) end year, after the start year
+
+    :return: Series indexed by county/UA ID, e.g. 0.0052 for 0.52% growth a year.
+    """
+    start, end = int(select_year), int(select_year1)
+    if end <= start:
+        raise ValueError('{} is incorrect, please provide start year before ({}).'.format(start, end))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rate = (cube.year(end) / cube.year(start)) ** (1 / (end - start)) - 1
+    return pd.Series(rate, index=pd.Index(cube.ids, name=cube.counties_UA_id), name='CAGR {}-{}'.format(start, end))
+
+
+def rolling_mean(cube, window=5):
+    """ Rolling mean population of every county/UA over the given number of years, ending at each year.
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param window: (int) number of years averaged
+
+    :return: DataFrame indexed by county/UA ID with a column for each year, NaN for the first window - 1 years and
+             where any year of the window has no data.
+    """
+    if not 1 <= window <= len(cube.years):
+        raise ValueError('window must be between 1 and {} years.'.format(len(cube.years)))
+    means = np.full_like(cube.values, np.nan)
+    means[:, window - 1:] = sliding_window_view(cube.values, window, axis=1).mean(axis=-1)
+    return _frame(cube, means, [str(yr) for yr in cube.years])
+
+
+def _fit(years, values):
+    """ Least squares line through each row of values against years, skipping NaN.
+
+    :return: tuple of (slope, intercept, r2, n) arrays, one value per row.
+    """
+    x = np.broadcast_to(years.astype('float64'), values.shape)
+    valid = ~np.isnan(values)
+    n = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = np.where(valid, x, 0).sum(axis=1) / n
+        y_mean = np.where(valid, values, 0).sum(axis=1) / n
+        dx = np.where(valid, x - x_mean[:, None], 0)
+        dy = np.where(valid, values - y_mean[:, None], 0)
+        slope = (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1)
+        intercept = y_mean - slope * x_mean
+        residual = np.where(valid, values - (intercept[:, None] + slope[:, None] * x), 0)
+        r2 = 1 - (residual ** 2).sum(axis=1) / (dy ** 2).sum(axis=1)
+    too_few = n < 2
+    slope[too_few], intercept[too_few], r2[too_few] = np.nan, np.nan, np.nan
+    return slope, intercept, r2, n
+
+
+def trend_fit(cube, select_year=None, select_year1=None, log=False):
+    """ Linear (or log-linear) trend of every county/UA's population over a range of years.
+
+    The linear trend is population = intercept + slope * year, the slope being the change in population a year. The
+    log-linear trend fits log(population), so exp(slope) - 1 is the trend growth rate a year.
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param select_year: (str or int) first year of the fit, the first year of the data if None
+    :param select_year1: (str or int) last year of the fit, the last year of the data if None
+    :param log: (bool) fit log(population) instead of population
+
+    :return: DataFrame indexed by county/UA ID with columns slope, intercept, r2 and n (years with data), plus
+             annual_growth for a log-linear fit.
+    """
+    years = _year_slice(cube, select_year, select_year1)
+    values = cube.values[:, years]
+    if log:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = np.log(np.where(values > 0, values, np.nan))
+    slope, intercept, r2, n = _fit(cube.years[years], values)
+    fits = _frame(cube, np.column_stack([slope, intercept, r2, n]), ['slope', 'intercept', 'r2', 'n'])
+    fits['n'] = fits['n'].astype('int64')
+    if log:
+        fits['annual_growth'] = np.exp(slope) - 1
+    return fits
+
+
+def project(cube, projection_years, select_year=None, select_year1=None, log=False):
+    """ Projects every county/UA's population to future (or past) years by extending its trend.
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param projection_years: (list) years to project to, e.g. [2025, 2030]
+    :param select_year: (str or int) first year of the trend fit, the first year of the data if None
+    :param select_year1: (str or int) last year of the trend fit, the last year of the data if None
+    :param log: (bool) extend a log-linear (constant growth rate) trend instead of a linear trend
+
+    :return: DataFrame indexed by county/UA ID with a column of projected population for each projection year.
+    """
+    fits = trend_fit(cube, select_year, select_year1, log)
+    years = np.asarray([int(yr) for yr in projection_years], dtype='float64')
+    projected = fits['intercept'].to_numpy()[:, None] + fits['slope'].to_numpy()[:, None] * years
+    if log:
+        projected = np.exp(projected)
+    return _frame(cube, projected, [str(int(yr)) for yr in years])
+
+
+def difference_tensor(cube, rows=None):
+    """ Population change between every pair of years for every county/UA.
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param rows: (array) row positions of the counties/UA to include, all if None. The tensor has
+                 rows x years x years values, select rows for large tables.
+
+    :return: array of shape (counties/UA, years, years) where [i, a, b] is the population of county/UA i in year b
+             minus its population in year a, with the year positions of cube.years. For example
+             tensor[:, cube.year_position(2002), cube.year_position(2019)] equals cube.change(2002, 2019).
+    """
+    values = cube.values if rows is None else cube.values[np.asarray(rows)]
+    return values[:, None, :] - values[:, :, None]
+
+
+@profiled()
+def trend_summary(cube, select_year, select_year1):
+    """ Table of the change, CAGR and linear and log-linear trends of every county/UA between two years.
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param select_year: (str or int) start year
+    :param select_year1: (str or int) end year
+
+    :return: DataFrame with county/UA name, ID and country, population change, CAGR, linear trend slope and r2 and
+             log-linear annual growth, in descending order of CAGR.
+    """
+    linear = trend_fit(cube, select_year, select_year1)
+    log_linear = trend_fit(cube, select_year, select_year1, log=True)
+    summary = cube.to_frame(years=[select_year, select_year1])
+    summary['Population change'] = cube.change(select_year, select_year1)
+    summary['CAGR'] = cagr(cube, select_year, select_year1).to_numpy()
+    summary['Trend per year'] = linear['slope'].to_numpy()
+    summary['Trend r2'] = linear['r2'].to_numpy()
+    summary['Trend growth'] = log_linear['annual_growth'].to_numpy()
+    return summary.sort_values('CAGR', ascending=False)
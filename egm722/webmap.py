@@ -0,0 +1,335 @@
+# Interactive map output: the counties/UA geometry written once as TopoJSON and the population of each year (and of each
+# population change period) as small separate .json files of numbers, so a browser client (d3, Leaflet, MapLibre, ...)
+# can draw any year or change period and restyle it without a map being rendered on the server.
+#
+# Output folder:
+#   index.json              - county/UA IDs in the order of the value files, years, file names and min/max of each file
+#   counties_UA.topojson    - geometry in lon/lat (epsg 4326), quantized, with shared borders stored once
+#   population/<year>.json  - [population, ...] in the order of the IDs in index.json, null where there is no data
+#   change/<start>_<end>.json - population change between two years, in the same order
+#
+# The geometry is only rewritten when the shapefile or simplification changes, a new year of data only adds its file.
+#
+#   python -m egm722.webmap --output-dir outputs/web --pairs 2002:2019
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from egm722.cube import COUNTIES_UA_SHP, COUNTRIES_SHP, OUTPUT_DIR, POPULATION_CSV, PopulationCube, parse_year_pairs
+from egm722.export import write_atomic
+from egm722.geometry import OSGB_EPSG, simplify_tolerance, source_hash
+from egm722.profiling import profiled
+
+WEB_EPSG = 4326  # lon/lat, as expected by browser map libraries
+QUANTIZATION = 100000  # TopoJSON grid size, 1e5 is about 10 m over the UK
+PRECISION = 1.0  # metres, coordinates closer than this are treated as the same point when finding shared borders
+GEOMETRY_FILE = 'counties_UA.topojson'
+INDEX_FILE = 'index.json'
+
+
+def _write_json(data, path):
+    with open(path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+
+
+def _save(data, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(write_atomic(data, path, _write_json), path)
+    return path
+
+
+def _polygon_rings(geometry, precision=PRECISION):
+    """ Rings of each polygon of a Polygon or MultiPolygon as lists of (x, y) grid points.
+
+    Exterior rings are clockwise and holes anticlockwise (the winding d3 expects), the closing point is left out and
+    points repeated after snapping to the precision grid are removed, as are rings left with fewer than 3 points.
+
+    :return: list with a list of rings for each polygon, the exterior ring first.
+    """
+    from shapely.geometry.polygon import orient
+    if geometry is None or geometry.is_empty:
+        return []
+    polygons = geometry.geoms if geometry.geom_type == 'MultiPolygon' else [geometry]
+    result = []
+    for polygon in polygons:
+        polygon = orient(polygon, sign=-1.0)
+        rings = []
+        for ring in [polygon.exterior] + list(polygon.interiors):
+            xy = np.rint(np.asarray(ring.coords)[:-1, :2] / precision).astype('int64')
+            xy = xy[np.any(xy != np.roll(xy, 1, axis=0), axis=1)]  # removes repeated points
+            if len(xy) >= 3:
+                rings.append([tuple(point) for point in xy.tolist()])
+            elif not rings:
+                break  # the exterior has collapsed, so the whole polygon is dropped
+        if rings:
+            result.append(rings)
+    return result
+
+
+def _junctions(rings):
+    """ Points where borders meet: points reached from different neighbouring points in different rings (or twice in
+    the same ring). Between two junctions a border is shared by the same rings, so it can be stored once.
+    """
+    neighbours = {}
+    junctions = set()
+    for ring in rings:
+        n = len(ring)
+        for i, point in enumerate(ring):
+            before, after = ring[i - 1], ring[(i + 1) % n]
+            pair = (before, after) if before < after else (after, before)
+            if neighbours.setdefault(point, pair) != pair:
+                junctions.add(point)
+    return junctions
+
+
+def _ring_arcs(ring, junctions):
+    """ Splits a ring into arcs at the junctions, a ring without junctions is one closed arc from its lowest point. """
+    positions = [i for i, point in enumerate(ring) if point in junctions]
+    start = positions[0] if positions else ring.index(min(ring))
+    points = ring[start:] + ring[:start] + [ring[start]]
+    if not positions:
+        return [points]
+    arcs, arc = [], [points[0]]
+    for point in points[1:]:
+        arc.append(point)
+        if point in junctions:
+            arcs.append(arc)
+            arc = [point]
+    return arcs
+
+
+def _ring_points(arcs, ring):
+    """ Points of a ring joined from its arcs (~i for an arc used in reverse). """
+    parts = [arcs[i] if i >= 0 else arcs[~i][::-1] for i in ring]
+    return np.concatenate([parts[0]] + [part[1:] for part in parts[1:]])
+
+
+def _shape(arcs, shape):
+    """ MultiPolygon of a shape (a list of polygons, each a list of rings of arc indices), None if a ring has collapsed.
+    """
+    from shapely.geometry import MultiPolygon, Polygon
+    polygons = []
+    for rings in shape:
+        points = [_ring_points(arcs, ring) for ring in rings]
+        if any(len(ring) < 4 for ring in points):
+            return None
+        polygons.append(Polygon(points[0], points[1:]))
+    return MultiPolygon(polygons)
+
+
+def _simplify_arcs(arcs, shapes, tolerance):
+    """ Douglas-Peucker simplification of each arc, keeping its end points so neighbouring polygons still meet.
+
+    The arcs of a shape that simplification would make invalid (a ring crossing itself or another ring, or left with
+    fewer than 3 points) are kept whole. That can change a neighbouring shape as well, so this is repeated until no
+    more arcs are restored.
+
+    :param arcs: (list) arcs as arrays of (x, y) in metres
+    :param shapes: (list) polygons of each shape, each polygon a list of rings of arc indices, exterior ring first
+    :param tolerance: (float) simplification tolerance in metres
+
+    :return: list of the simplified arcs.
+    """
+    from shapely.geometry import LineString
+    simplified = [arc if len(arc) <= 2 or not tolerance else
+                  np.asarray(LineString(arc).simplify(tolerance, preserve_topology=False).coords) for arc in arcs]
+    shape_arcs = [{i if i >= 0 else ~i for rings in shape for ring in rings for i in ring} for shape in shapes]
+    candidates = range(len(shapes))
+    while candidates:
+        restored = set()
+        for k in candidates:
+            shape = _shape(simplified, shapes[k])
+            if shape is not None and shape.is_valid:
+                continue
+            if not _shape(arcs, shapes[k]).is_valid:
+                continue  # invalid before simplification, keeping the whole arcs would not help
+            for i in shape_arcs[k]:
+                if simplified[i] is not arcs[i]:
+                    simplified[i] = arcs[i]
+                    restored.add(i)
+        candidates = [k for k, indices in enumerate(shape_arcs) if indices & restored]
+    return simplified
+
+
+def topology(layer, ids, properties=None, tolerance=None, quantization=QUANTIZATION, epsg=WEB_EPSG,
+             object_name='counties_UA', precision=PRECISION):
+    """ Encodes polygons as TopoJSON, borders shared by neighbouring polygons stored (and simplified) once.
+
+    :param layer: (GeoSeries) polygons in a projected crs in metres, e.g. the counties/UA geometry in OSGB
+    :param ids: (list) ID of each polygon, the TopoJSON geometry id
+    :param properties: (list) dict of properties of each polygon, e.g. name and country, None for no properties
+    :param tolerance: (float) simplification tolerance in metres, None or 0 to keep every point
+    :param quantization: (int) size of the TopoJSON coordinate grid
+    :param epsg: (int) epsg code of the TopoJSON coordinates
+    :param object_name: (str) name of the geometry collection in the TopoJSON objects
+    :param precision: (float) grid size in metres used to match the points of neighbouring polygons
+
+    :return: dict of the TopoJSON topology, ready for json.dump().
+    """
+    from pyproj import Transformer
+
+    shapes = [_polygon_rings(geometry, precision) for geometry in layer]
+    junctions = _junctions([ring for shape in shapes for polygon in shape for ring in polygon])
+
+    arcs, arc_ids = [], {}
+
+    def arc_index(points):
+        key = tuple(points)
+        if key in arc_ids:
+            return arc_ids[key]
+        if key[::-1] in arc_ids:
+            return ~arc_ids[key[::-1]]  # the same border walked the other way, by the neighbouring polygon
+        arc_ids[key] = len(arcs)
+        arcs.append(np.asarray(points, dtype='float64') * precision)
+        return arc_ids[key]
+
+    shape_arcs = [[[[arc_index(arc) for arc in _ring_arcs(ring, junctions)] for ring in polygon] for polygon in shape]
+                  for shape in shapes]
+    arcs = _simplify_arcs(arcs, shape_arcs, tolerance)
+
+    # project every arc point at once and quantize to the TopoJSON grid
+    lengths = [len(arc) for arc in arcs]
+    xy = np.concatenate(arcs) if arcs else np.empty((0, 2))
+    transformer = Transformer.from_crs(layer.crs, 'EPSG:{}'.format(epsg), always_xy=True)
+    x, y = transformer.transform(xy[:, 0], xy[:, 1])
+    xy = np.column_stack([x, y])
+    low, high = (xy.min(axis=0), xy.max(axis=0)) if len(xy) else (np.zeros(2), np.ones(2))
+    scale = np.where(high > low, (high - low) / (quantization - 1), 1)
+    grid = np.rint((xy - low) / scale).astype('int64')
+    encoded = []
+    for arc in np.split(grid, np.cumsum(lengths)[:-1]):
+        keep = np.r_[True, np.any(arc[1:] != arc[:-1], axis=1)]
+        keep[-1] = True
+        arc = arc[keep]
+        encoded.append(np.vstack([arc[:1], np.diff(arc, axis=0)]).tolist())  # delta encoded
+
+    geometries = []
+    for i, polygons in enumerate(shape_arcs):
+        geometry = {'id': ids[i]}
+        if not polygons:
+            geometry['type'] = None
+        elif len(polygons) == 1:
+            geometry['type'], geometry['arcs'] = 'Polygon', polygons[0]
+        else:
+            geometry['type'], geometry['arcs'] = 'MultiPolygon', polygons
+        if properties is not None:
+            geometry['properties'] = properties[i]
+        geometries.append(geometry)
+    return {'type': 'Topology', 'bbox': [float(v) for v in np.r_[low, high]],
+            'transform': {'scale': [float(v) for v in scale], 'translate': [float(v) for v in low]},
+            'objects': {object_name: {'type': 'GeometryCollection', 'geometries': geometries}}, 'arcs': encoded}
+
+
+def value_list(values):
+    """ Population values as a JSON list, whole numbers as int and nodata (NaN) as None (null). """
+    return [None if np.isnan(value) else int(value) if value.is_integer() else round(value, 6)
+            for value in np.asarray(values, dtype='float64').tolist()]
+
+
+def _value_file(values, output_dir, folder, name):
+    """ Writes the value file <folder>/<name>.json and returns its index.json entry. """
+    _save(value_list(values), os.path.join(output_dir, folder, name + '.json'))
+    valid = values[~np.isnan(values)]
+    low, high = value_list([valid.min(), valid.max()]) if len(valid) else (None, None)
+    return {'file': '{}/{}.json'.format(folder, name), 'min': low, 'max': high}
+
+
+@profiled(rows=lambda written, *args, **kwargs: len(written['population']) + len(written['change']))
+def export_webmap(cube, counties_UA_shp=COUNTIES_UA_SHP, output_dir=None, change_pairs=None, tolerance=None, dpi=300,
+                  quantization=QUANTIZATION, force=False):
+    """ Writes the TopoJSON geometry, a population file for every year and a change file for every change period.
+
+    :param cube: (PopulationCube) population data loaded once from the datasets
+    :param counties_UA_shp: (str) counties/unitary authority shapefile, read only when the geometry is (re)written
+    :param output_dir: (str) output folder, the web folder of the outputs folder if None
+    :param change_pairs: (list) (start year, end year) pairs to write change files for, first year to last if None
+    :param tolerance: (float) simplification tolerance in metres, by default the size of a pixel of a map at dpi
+    :param dpi: (int) resolution the default tolerance is worked out for
+    :param quantization: (int) size of the TopoJSON coordinate grid
+    :param force: (bool) rewrite the geometry even if the shapefile and settings have not changed
+
+    :return: dict with the written 'geometry' path (None if it was up to date), 'population' and 'change' file paths
+             and the 'index' path.
+    """
+    output_dir = os.path.join(OUTPUT_DIR, 'web') if output_dir is None else output_dir
+    change_pairs = [(cube.years[0], cube.years[-1])] if change_pairs is None else change_pairs
+    index_path = os.path.join(output_dir, INDEX_FILE)
+    geometry_path = os.path.join(output_dir, GEOMETRY_FILE)
+    settings = {'source': source_hash(counties_UA_shp), 'tolerance': tolerance, 'dpi': dpi,
+                'quantization': quantization, 'epsg': WEB_EPSG}
+
+    previous = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            previous = json.load(f)
+    written = {'geometry': None, 'population': [], 'change': [], 'index': index_path}
+    if not force and previous.get('settings') == settings and os.path.exists(geometry_path):
+        ids = previous['ids']
+    else:
+        from egm722.geometry import load_geometry
+        counties_UA = load_geometry(counties_UA_shp)
+        ids = counties_UA[cube.counties_UA_id].tolist()
+        rows = [cube.id_index.get(county_id) for county_id in ids]
+        properties = [{'name': None if row is None else cube.names[row],
+                       'country': None if row is None or not isinstance(cube.countries[row], str) else
+                       cube.countries[row]} for row in rows]
+        layer = counties_UA.geometry
+        if layer.crs is None or layer.crs.to_epsg() != OSGB_EPSG:
+            layer = layer.to_crs(epsg=OSGB_EPSG)
+        topo_tolerance = simplify_tolerance(layer.total_bounds, dpi) if tolerance is None else tolerance
+        written['geometry'] = _save(topology(layer, ids, properties, topo_tolerance, quantization), geometry_path)
+
+    rows = np.asarray([cube.id_index.get(county_id, -1) for county_id in ids])
+    values = np.where((rows >= 0)[:, None], cube.values[rows], np.nan)  # in the order of the geometry
+    population, change = {}, {}
+    for j, year in enumerate(cube.years):
+        population[str(year)] = _value_file(values[:, j], output_dir, 'population', str(year))
+        written['population'].append(os.path.join(output_dir, 'population', '{}.json'.format(year)))
+    for start, end in change_pairs:
+        name = '{}_{}'.format(start, end)
+        change[name] = _value_file(values[:, cube.year_position(end)] - values[:, cube.year_position(start)],
+                                   output_dir, 'change', name)
+        written['change'].append(os.path.join(output_dir, 'change', name + '.json'))
+
+    for folder, entries in (('population', population), ('change', change)):  # files of years/periods no longer written
+        current = {entry['file'] for entry in entries.values()}
+        if not os.path.isdir(os.path.join(output_dir, folder)):
+            continue
+        for file_name in os.listdir(os.path.join(output_dir, folder)):
+            if file_name.endswith('.json') and '{}/{}'.format(folder, file_name) not in current:
+                os.remove(os.path.join(output_dir, folder, file_name))
+
+    # written last, so a client never reads an index naming files that are not there yet
+    _save({'geometry': GEOMETRY_FILE, 'object': 'counties_UA', 'id_column': cube.counties_UA_id, 'ids': ids,
+           'years': [int(year) for year in cube.years], 'population': population, 'change': change,
+           'settings': settings}, index_path)
+    return written
+
+
+def main(argv=None):
+    """ Writes the interactive map files from the command line, e.g. python -m egm722.webmap --pairs 2002:2019 """
+    parser = argparse.ArgumentParser(description='Write TopoJSON geometry and per-year population files for web maps.')
+    parser.add_argument('--population-csv', default=POPULATION_CSV, help='population table')
+    parser.add_argument('--counties-shp', default=COUNTIES_UA_SHP, help='counties/unitary authority shapefile')
+    parser.add_argument('--countries-shp', default=COUNTRIES_SHP, help='country shapefile')
+    parser.add_argument('--output-dir', default=os.path.join(OUTPUT_DIR, 'web'), help='output folder')
+    parser.add_argument('--pairs', default=None, help='change periods, e.g. 2002:2019,1991:2019')
+    parser.add_argument('--tolerance', type=float, default=None, help='simplification tolerance in metres')
+    parser.add_argument('--dpi', type=int, default=300, help='map resolution of the default tolerance')
+    parser.add_argument('--quantization', type=int, default=QUANTIZATION, help='TopoJSON grid size')
+    parser.add_argument('--force', action='store_true', help='rewrite the geometry')
+    args = parser.parse_args(argv)
+
+    cube = PopulationCube.from_files(args.population_csv, args.counties_shp, args.countries_shp)
+    written = export_webmap(cube, args.counties_shp, args.output_dir, parse_year_pairs(args.pairs) if args.pairs else None,
+                            args.tolerance, args.dpi, args.quantization, args.force)
+    print('Geometry: ' + (written['geometry'] or 'up to date'))
+    print('{} population and {} change files, index {}'.format(len(written['population']), len(written['change']),
+                                                              written['index']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the egm722 package
+
+from egm722.cube import POPULATION_CSV, PopulationCube  # noqa: E402
+
+
+@pytest.fixture
+def small_cube():
+    """ Five counties/UA in two countries (and one with no country) over four years, with some nodata. """
+    ids = ['A1', 'A2', 'A3', 'B1', 'X1']
+    names = ['Alpha', 'Beta', 'Gamma', 'Delta', 'Nowhere']
+    countries = ['England', 'England', 'England', 'Wales', None]
+    values = np.array([[100, 110, 121, 133.1],
+                       [200, np.nan, 180, 190],
+                       [50, 60, 70, 80],
+                       [np.nan, np.nan, 40, 44],
+                       [5, 5, 5, 5]], dtype='float64')
+    return PopulationCube(ids, names, countries, [2000, 2001, 2002, 2003], values)
+
+
+@pytest.fixture(scope='session')
+def training_cube():
+    """ Cube of the training data, skipped if the data files are not there. """
+    if not os.path.exists(POPULATION_CSV):
+        pytest.skip('training data not found')
+    return PopulationCube.from_files()
+
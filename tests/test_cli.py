@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from egm722.cli import main
+from egm722.cube import POPULATION_CSV
+
+pytestmark = pytest.mark.skipif(not os.path.exists(POPULATION_CSV), reason='training data not found')
+
+
+@pytest.mark.parametrize('argv', [['stats', '1800'], ['county', 'Nowhere'], ['country', 'Englnd', '--year', '2006'],
+                                  ['change', '2019', '2002', '--trends']])
+def test_bad_selection_is_a_usage_error(argv, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        main(argv)
+    assert exit_info.value.code == 2
+    assert 'error:' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('argv, name', [(['change', '2002', '2019'], 'population_change_2002_2019.csv'),
+                                        (['country', '--year', '2006'], 'country_totals_2006.csv'),
+                                        (['county', 'Conwy'], 'counties_UA_name_Conwy.csv')])
+def test_write_saves_the_table(argv, name, tmp_path, capsys):
+    assert main(['--write', '--output-dir', str(tmp_path)] + argv) == 0
+    assert os.listdir(str(tmp_path)) == [name]
+    assert 'Saved' in capsys.readouterr().out
+
+
+def test_country_total(capsys):
+    assert main(['country', 'England', '--year', '2006']) == 0
+    assert 'Total population of England in 2006 was 50,965,186.' in capsys.readouterr().out
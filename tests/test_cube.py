@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from egm722.cube import NO_DATA, PopulationCube
+
+
+def test_lookups(small_cube):
+    assert small_cube.year_position('2002') == 2
+    assert small_cube.county_position('Gamma') == small_cube.county_position('A3') == 2
+    assert small_cube.country_position('wales') == 1
+    np.testing.assert_array_equal(small_cube.county('Gamma'), [50, 60, 70, 80])
+    np.testing.assert_array_equal(small_cube.country_rows_of('England'), [0, 1, 2])
+
+
+@pytest.mark.parametrize('query, value', [('year_position', 1990), ('county_position', 'Omega'),
+                                          ('country_position', 'Scotland')])
+def test_unknown_selection_raises_key_error(small_cube, query, value):
+    with pytest.raises(KeyError):
+        getattr(small_cube, query)(value)
+
+
+def test_nodata_is_skipped(small_cube):
+    # nodata counts as zero in country totals (as DataFrame.sum()) and is left out of the statistics
+    assert small_cube.country_year('England', 2001) == 170
+    assert small_cube.country_year('Wales', 2000) == 0
+    statistics = small_cube.year_statistics(2001)
+    assert statistics['sum'] == 175
+    assert statistics['mean'] == pytest.approx(175 / 3)
+    assert (statistics['min'], statistics['max']) == (5, 110)
+
+
+def test_country_all_year_whole_numbers(small_cube):
+    totals = small_cube.country_all_year(2002)
+    assert totals.dtype == 'int64'
+    assert totals.to_dict() == {'England': 371, 'Wales': 40}
+    assert small_cube.country_all_year(2003).dtype == 'float64'  # 133.1 is not a whole number
+
+
+def test_to_frame_keeps_nodata_empty(small_cube):
+    table = small_cube.to_frame(rows=[0, 1], years=[2000, 2002])
+    assert list(table.columns[3:]) == ['2000', '2002']
+    assert str(table['2000'].dtype) == 'Int64'
+    assert table['2000'].tolist() == [100, 200]
+
+
+def test_nodata_markers(tmp_path):
+    path = tmp_path / 'population.csv'
+    pd.DataFrame({'County / unitary (as of April 2021)': ['Alpha', 'Beta', 'Gamma', 'Delta'],
+                  'CTYUA20CD': ['A1', 'A2', 'A3', 'A4'], '2000': ['100', '-', ':', '..']}).to_csv(path, index=False)
+    cube = PopulationCube.from_frame(pd.read_csv(path, na_values=NO_DATA))
+    assert np.isnan(cube.year(2000)).tolist() == [False, True, True, True]
+
+
+def test_training_data_totals(training_cube):
+    assert training_cube.country_year('England', 2006) == 50965186
+    assert training_cube.country_all_year(2002).sum() == 59365677
+    northern_ireland = training_cube.values[training_cube.country_rows_of('Northern Ireland')]
+    assert np.isnan(northern_ireland[:, training_cube.years <= 2000]).all()  # no data collected 1991-2000
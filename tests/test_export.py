@@ -0,0 +1,67 @@
+import os
+
+import pandas as pd
+import pytest
+
+from egm722.export import WRITERS, OutputBatch, prepare_table, register_writer, write_table
+
+
+@pytest.fixture
+def failing_format():
+    def write(table, path):
+        if 'fail' in table.columns:
+            raise OSError('disk full')
+        table.to_csv(path, index=False)
+    register_writer('failing', '.csv', write)
+    yield 'failing'
+    del WRITERS['failing']
+
+
+def test_batch_writes_all_tables(tmp_path):
+    with OutputBatch(str(tmp_path), 'csv') as batch:
+        first = batch.add(pd.DataFrame({'a': [1, 2]}), 'first')
+        batch.add(pd.DataFrame({'b': [3]}), 'second')
+    assert pd.read_csv(first)['a'].tolist() == [1, 2]
+    assert sorted(os.listdir(str(tmp_path))) == ['first.csv', 'second.csv']
+    assert oct(os.stat(first).st_mode & 0o777) == oct(0o644)
+
+
+def test_failed_batch_keeps_previous_outputs(tmp_path, failing_format):
+    path = write_table(pd.DataFrame({'a': [1]}), 'first', str(tmp_path))
+    os.chmod(path, 0o600)
+    batch = OutputBatch(str(tmp_path), failing_format)
+    batch.add(pd.DataFrame({'a': [2]}), 'first')
+    batch.add(pd.DataFrame({'fail': [3]}), 'second')
+    with pytest.raises(OSError):
+        batch.commit()
+    assert os.listdir(str(tmp_path)) == ['first.csv']  # no temporary files left either
+    assert pd.read_csv(path)['a'].tolist() == [1]
+
+    write_table(pd.DataFrame({'a': [2]}), 'first', str(tmp_path))
+    assert oct(os.stat(path).st_mode & 0o777) == oct(0o600)  # a replaced file keeps its permissions
+
+
+def test_batch_discarded_after_an_error(tmp_path):
+    with pytest.raises(RuntimeError):
+        with OutputBatch(str(tmp_path)) as batch:
+            batch.add(pd.DataFrame({'a': [1]}), 'first')
+            raise RuntimeError
+    assert not os.path.exists(str(tmp_path / 'first.csv'))
+
+
+def test_geometry_modes():
+    gpd = pytest.importorskip('geopandas')
+    from shapely.geometry import Point
+    table = gpd.GeoDataFrame({'CTYUA20CD': ['A1'], 'population': [100]}, geometry=[Point(0, 0)])
+    assert list(prepare_table(table, 'id').columns) == ['CTYUA20CD', 'population']
+    assert type(prepare_table(table, 'drop')) is pd.DataFrame
+    assert prepare_table(table, 'keep') is table
+    with pytest.raises(ValueError):
+        prepare_table(table.drop(columns='CTYUA20CD'), 'id')
+    with pytest.raises(ValueError):
+        prepare_table(table, 'simplify')
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        OutputBatch(str(tmp_path), 'xlsx')
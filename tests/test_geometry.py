@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+gpd = pytest.importorskip('geopandas')
+from shapely.geometry import box  # noqa: E402
+
+from egm722.geometry import cache_path, load_geometry, simplified_column  # noqa: E402
+
+
+def _shapefile(path, size=1000):
+    gpd.GeoDataFrame({'name': ['a']}, geometry=[box(300000, 400000, 300000 + size, 400000 + size)],
+                     crs='EPSG:27700').to_file(str(path))
+    return str(path)
+
+
+def test_cache_is_read_back(tmp_path):
+    shp = _shapefile(tmp_path / 'Counties.shp')
+    cache_dir = str(tmp_path / 'cache')
+    layer = load_geometry(shp, cache_dir)
+    assert os.path.exists(cache_path(shp, cache_dir))
+    assert simplified_column(300) in layer and 'centroid' in layer
+    assert load_geometry(shp, cache_dir)['name'].tolist() == ['a']
+
+
+def test_rebuild_removes_only_older_copies(tmp_path):
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    older = cache_dir / 'Counties_0123456789abcdef.parquet'
+    other = cache_dir / 'Counties_and_Unitary_Authorities_0123456789abcdef.parquet'  # another shapefile's cache
+    older.write_bytes(b'')
+    other.write_bytes(b'')
+    load_geometry(_shapefile(tmp_path / 'Counties.shp'), str(cache_dir))
+    assert not older.exists()
+    assert other.exists()
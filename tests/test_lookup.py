@@ -0,0 +1,43 @@
+import pytest
+
+gpd = pytest.importorskip('geopandas')
+from shapely.geometry import box  # noqa: E402
+
+from egm722.lookup import build_country_lookup, load_country_lookup  # noqa: E402
+
+
+@pytest.fixture
+def countries():
+    # England with an inland sea (a hole) in the middle, Wales to the east of it
+    return gpd.GeoDataFrame({'CTRY20NM': ['England', 'Wales']},
+                            geometry=[box(0, 0, 10000, 10000).difference(box(3000, 3000, 7000, 7000)),
+                                      box(10000, 0, 20000, 10000)], crs='EPSG:27700')
+
+
+@pytest.fixture
+def counties_UA():
+    return gpd.GeoDataFrame({'CTYUA20CD': ['C1', 'C2', 'C3', 'C4'], 'code': ['c1', 'c2', 'c3', 'c4']},
+                            geometry=[box(500, 500, 1500, 1500),  # inside England
+                                      box(2000, 2000, 8000, 8000).difference(box(3000, 3000, 7000, 7000)),  # ring
+                                      box(18000, 0, 30000, 10000),  # mostly in the sea, overlapping Wales
+                                      box(40000, 0, 41000, 1000)],  # offshore
+                            crs='EPSG:27700')
+
+
+def test_fallback_rules(counties_UA, countries):
+    lookup = build_country_lookup(counties_UA, countries)
+    assert lookup['CTRY20NM'].to_dict() == {'C1': 'England', 'C2': 'England', 'C3': 'Wales', 'C4': 'Wales'}
+    assert lookup['method'].to_dict() == {'C1': 'centroid', 'C2': 'representative_point', 'C3': 'overlap',
+                                          'C4': 'nearest'}
+
+
+def test_persisted_lookup_is_keyed_by_columns(counties_UA, countries, tmp_path):
+    counties_UA_shp, countries_shp = str(tmp_path / 'counties.shp'), str(tmp_path / 'countries.shp')
+    counties_UA.to_file(counties_UA_shp)
+    countries.to_file(countries_shp)
+    cache_dir = str(tmp_path / 'cache')
+    first = load_country_lookup(counties_UA_shp, countries_shp, cache_dir)
+    assert load_country_lookup(counties_UA_shp, countries_shp, cache_dir).to_dict() == first.to_dict()  # from cache
+    by_code = load_country_lookup(counties_UA_shp, countries_shp, cache_dir, counties_UA_id='code')
+    assert by_code.index.name == 'code'
+    assert by_code['CTRY20NM'].to_dict() == {'c1': 'England', 'c2': 'England', 'c3': 'Wales', 'c4': 'Wales'}
@@ -0,0 +1,71 @@
+import os
+
+import pandas as pd
+import pytest
+
+from egm722.cube import COUNTIES_UA_SHP, COUNTRIES_SHP, POPULATION_CSV
+from egm722.pipeline import plan_targets, run_pipeline, stale_targets
+
+
+@pytest.fixture
+def targets(tmp_path):
+    targets = plan_targets([2000, 2001], ['Wales'], [(2000, 2001)], str(tmp_path))
+    for target in targets:
+        with open(target.path, 'w'):
+            pass
+    return targets
+
+
+def _manifest(targets, fingerprints):
+    return {target.name: {'deps': {key: fingerprints[key] for key in target.deps}, 'path': target.path}
+            for target in targets}
+
+
+FINGERPRINTS = {'rows': 'r', 'counties_UA': 'c', 'countries': 'n', 'population:2000': 'p0', 'population:2001': 'p1',
+                'setting:geometry': 'id', 'setting:dpi': 300}
+
+
+def test_nothing_stale(targets):
+    assert stale_targets(targets, FINGERPRINTS, _manifest(targets, FINGERPRINTS)) == []
+
+
+def test_changed_year_rebuilds_its_outputs(targets):
+    changed = dict(FINGERPRINTS, **{'population:2001': 'new'})
+    stale = {target.name for target in stale_targets(targets, changed, _manifest(targets, FINGERPRINTS))}
+    assert stale == {'country_population_all', 'population_statistics_all_years', 'country_Wales_population',
+                     'CTYUA20CD_2001', 'year_map_2001', 'pie_2001', 'change_map_2000_2001'}
+
+
+def test_changed_dpi_rebuilds_the_figures(targets):
+    changed = dict(FINGERPRINTS, **{'setting:dpi': 100})
+    stale = {target.name for target in stale_targets(targets, changed, _manifest(targets, FINGERPRINTS))}
+    assert stale == {'year_map_2000', 'year_map_2001', 'pie_2000', 'pie_2001', 'change_map_2000_2001'}
+
+
+def test_missing_or_new_outputs_are_stale(targets):
+    manifest = _manifest(targets, FINGERPRINTS)
+    os.remove(targets[0].path)
+    del manifest[targets[1].name]
+    assert stale_targets(targets, FINGERPRINTS, manifest) == targets[:2]
+
+
+def test_new_year_builds_only_what_depends_on_it(tmp_path):
+    if not os.path.exists(POPULATION_CSV):
+        pytest.skip('training data not found')
+    population_csv = str(tmp_path / 'population.csv')
+    population_df = pd.read_csv(POPULATION_CSV, dtype=str)
+    population_df.to_csv(population_csv, index=False)
+    output_dir = str(tmp_path / 'outputs')
+
+    first = run_pipeline(population_csv, COUNTIES_UA_SHP, COUNTRIES_SHP, output_dir, maps=False)
+    assert first['skipped'] == []
+    assert run_pipeline(population_csv, COUNTIES_UA_SHP, COUNTRIES_SHP, output_dir, maps=False)['built'] == []
+
+    population_df['2020'] = population_df['2019']
+    population_df.to_csv(population_csv, index=False)
+    built = run_pipeline(population_csv, COUNTIES_UA_SHP, COUNTRIES_SHP, output_dir, maps=False)['built']
+    assert sorted(built) == sorted(['country_population_all', 'population_statistics_all_years', 'CTYUA20CD_2020'] +
+                                   [name for name in first['built'] if name.startswith('country_')
+                                    and name != 'country_population_all'])
+    assert run_pipeline(population_csv, COUNTIES_UA_SHP, COUNTRIES_SHP, output_dir, maps=False,
+                        geometry='drop')['skipped'] == []  # the geometry option changes every table
@@ -0,0 +1,77 @@
+import pandas as pd
+import pytest
+
+from egm722.scenarios import evaluate_scenarios, expand_scenarios, scenario_tables
+from egm722.timeseries import cagr
+
+
+def test_defaults_and_list_expansion():
+    scenarios = expand_scenarios({'defaults': {'select_year': 2000, 'select_year1': 2003},
+                                  'scenarios': [{'name': 'alpha', 'select_county_UA': 'Alpha'},
+                                                {'select_county_UA': ['Beta', 'Gamma'], 'select_year': [2000, 2001]},
+                                                {'name': 'alpha', 'select_country': 'Wales'}]})
+    assert [scenario['name'] for scenario in scenarios] == ['alpha', '2000_2003_Beta', '2000_2003_Gamma',
+                                                            '2001_2003_Beta', '2001_2003_Gamma', 'alpha_2']
+    assert scenarios[3]['select_year'] == 2001 and scenarios[3]['select_year1'] == 2003
+    assert scenarios[0]['maps'] is None
+
+
+def test_unknown_key():
+    with pytest.raises(ValueError):
+        expand_scenarios([{'select_yr': 2000}])
+
+
+def test_matches_single_scenario_functions(small_cube):
+    scenarios = expand_scenarios([{'select_year': 2000, 'select_year1': 2003, 'select_county_UA': ['Alpha', 'Gamma'],
+                                   'select_country': 'England'}])
+    results = evaluate_scenarios(small_cube, scenarios).set_index('select_county_UA')
+    rates = cagr(small_cube, 2000, 2003)
+    for name in ['Alpha', 'Gamma']:
+        row = small_cube.county_position(name)
+        assert results.loc[name, 'county_population'] == small_cube.values[row, 0]
+        assert results.loc[name, 'county_change'] == pytest.approx(small_cube.change(2000, 2003)[row])
+        assert results.loc[name, 'county_cagr'] == pytest.approx(rates.iloc[row])
+    statistics = small_cube.year_statistics(2000)
+    assert results.loc['Alpha', 'uk_population'] == statistics['sum']
+    assert results.loc['Alpha', 'ua_mean'] == pytest.approx(statistics['mean'])
+    assert results.loc['Alpha', 'country_population'] == small_cube.country_year('England', 2000)
+    assert results.loc['Gamma', 'county_rank'] == 3
+    assert results.loc['Alpha', 'largest_growth_UA'] == 'Alpha' and results.loc['Alpha', 'largest_loss_UA'] == 'Beta'
+
+
+def test_country_without_data_is_missing(small_cube):
+    # Wales (Delta) has no data until 2002: no population rather than 0, and no change or growth from it
+    results = evaluate_scenarios(small_cube, expand_scenarios([{'select_country': 'Wales', 'select_year': 2000,
+                                                                'select_year1': 2003}])).iloc[0]
+    assert pd.isna(results['country_population'])
+    assert pd.isna(results['country_change']) and pd.isna(results['country_cagr'])
+    assert results['uk_change'] == pytest.approx(133.1 - 100 + 190 - 200 + 80 - 50)  # counties with data in both
+
+
+def test_training_data_northern_ireland(training_cube):
+    results = evaluate_scenarios(training_cube, expand_scenarios([{'select_country': 'Northern Ireland',
+                                                                   'select_year': 1995, 'select_year1': 2005}]))
+    row = results.iloc[0]
+    assert pd.isna(row['country_population']) and pd.isna(row['country_share'])
+    assert pd.isna(row['country_change']) and pd.isna(row['country_cagr'])
+    assert row['uk_change'] == row['uk_population1'] - row['country_population1'] - row['uk_population']
+
+
+def test_equal_and_reversed_years(small_cube):
+    scenarios = expand_scenarios([{'select_county_UA': 'Alpha', 'select_year': 2001, 'select_year1': 2001},
+                                  {'select_year': 2002, 'select_year1': 2001}, {'select_year1': 2001},
+                                  {'select_county_UA': 'Alpha', 'maps': True}])
+    results = evaluate_scenarios(small_cube, scenarios)
+    assert results['error'].tolist()[1:] == ['select_year1 must be after select_year.',
+                                             'select_year1 needs a select_year.', 'maps needs a select_year to map.']
+    same_year = results.iloc[0]
+    assert same_year['error'] is None
+    assert same_year['county_population'] == 110
+    assert pd.isna(same_year['county_change'])
+    assert list(scenario_tables(small_cube, scenarios[0], {})) == ['CTYUA20CD_2001', 'counties_UA_name_Alpha']
+
+
+def test_unknown_selection_is_a_scenario_error(small_cube):
+    results = evaluate_scenarios(small_cube, expand_scenarios([{'select_county_UA': ['Alpha', 'Omega']}]))
+    assert results['error'].isna().tolist() == [True, False]
+    assert 'Omega' in results['error'].iloc[1]
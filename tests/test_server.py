@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+import pytest
+
+from egm722.server import PopulationService
+
+
+def _respond(service, target):
+    status, content_type, body = asyncio.run(service.respond(target))
+    return status, json.loads(body) if content_type == 'application/json' else body
+
+
+@pytest.fixture
+def service(small_cube):
+    return PopulationService(small_cube)
+
+
+def test_queries(service):
+    status, body = _respond(service, '/countries?year=2002')
+    assert status == 200
+    assert body == {'year': 2002, 'countries': {'England': 371, 'Wales': 40}}
+    status, body = _respond(service, '/county?name=Beta')
+    assert status == 200 and body['2001'] is None  # nodata is null
+    status, body = _respond(service, '/change?start=2000&end=2003')
+    assert [row['CTYUA20CD'] for row in body['counties_UA']][:2] == ['A1', 'A3']
+
+
+@pytest.mark.parametrize('target, status', [('/year?year=1990', 404), ('/county?name=Omega', 404),
+                                            ('/country?country=Scotland&year=2002', 404), ('/nowhere', 404),
+                                            ('/year', 400), ('/change?start=2000', 400), ('/year?year=abc', 404),
+                                            ('/map.png?start=2000', 400)])
+def test_errors(service, target, status):
+    code, body = _respond(service, target)
+    assert code == status
+    assert 'error' in body
+
+
+def test_responses_are_cached(service):
+    _respond(service, '/countries?year=2002')
+    _respond(service, '/countries?year=2002')
+    _respond(service, '/year?year=1990')  # errors are not cached
+    _, health = _respond(service, '/health')
+    assert (health['cache_entries'], health['cache_hits']) == (1, 1)
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from egm722.stats import batch_statistics, select_statistics
+
+
+def _groupby_statistics(cube, groups):
+    """ The country/UK statistics worked out the pandas way, one groupby per year. """
+    frame = cube.to_frame().astype({str(yr): 'float64' for yr in cube.years})
+    frame['group'] = groups
+    frame = frame[frame['group'].notna()]
+    rows = []
+    for year in cube.years:
+        grouped = frame.groupby('group')[str(year)]
+        table = pd.DataFrame({'population': grouped.sum(min_count=1), 'mean': grouped.mean(), 'min': grouped.min(),
+                              'max': grouped.max(), 'count': grouped.count()})
+        table['year'] = year
+        rows.append(table.rename_axis('region').reset_index())
+    return pd.concat(rows).sort_values(['region', 'year'], ignore_index=True)
+
+
+@pytest.mark.parametrize('level', ['country', 'UK'])
+def test_batch_statistics_matches_groupby(small_cube, level):
+    groups = small_cube.countries if level == 'country' else ['UK'] * len(small_cube)
+    expected = _groupby_statistics(small_cube, groups)
+    statistics = batch_statistics(small_cube, levels=[level]).sort_values(['region', 'year'], ignore_index=True)
+    for column in ['population', 'mean', 'min', 'max', 'count']:
+        np.testing.assert_allclose(statistics[column].astype('float64'), expected[column].astype('float64'),
+                                   err_msg=column)
+
+
+def test_batch_statistics_rank_and_change(small_cube):
+    statistics = batch_statistics(small_cube, levels=['UA'])
+    alpha = statistics[statistics['region'] == 'Alpha']
+    assert alpha['change'].tolist()[1:] == pytest.approx([10, 11, 12.1])
+    assert np.isnan(alpha['change'].iloc[0])
+    ranks = select_statistics(statistics, 'UA', 2002)
+    assert ranks['region'].tolist() == ['Beta', 'Alpha', 'Gamma', 'Delta', 'Nowhere']
+    assert ranks['rank'].tolist() == [1, 2, 3, 4, 5]
+
+
+def test_region_without_data_is_empty(small_cube):
+    wales = select_statistics(batch_statistics(small_cube, levels=['country']), 'country', region='Wales')
+    assert wales['population'].isna().tolist() == [True, True, False, False]
+    assert wales['count'].tolist() == [0, 0, 1, 1]
+
+
+def test_unknown_level(small_cube):
+    with pytest.raises(ValueError):
+        batch_statistics(small_cube, levels=['county'])
+
+
+def test_training_data_example_row(training_cube):
+    england = select_statistics(batch_statistics(training_cube), 'country', 2006, 'England').iloc[0]
+    assert england['population'] == 50965186
+    assert england['count'] == 151
+    assert england['rank'] == 1
+
+
+def test_change_over_counties_with_data_in_both_years(small_cube):
+    # Beta has no data in 2001 and Delta starts in 2002, neither is counted as a change of England or the UK
+    statistics = batch_statistics(small_cube, levels=['country', 'UK'])
+    england = select_statistics(statistics, 'country', region='England')
+    assert england['change'].tolist()[1:] == pytest.approx([20, 21, 32.1])
+    assert england['pct_change'].iloc[1] == pytest.approx(20 / 150 * 100)
+    uk = select_statistics(statistics, 'UK')
+    assert uk['change'].iloc[2] == pytest.approx(21)
+    wales = select_statistics(statistics, 'country', region='Wales')
+    assert wales['change'].isna().tolist() == [True, True, True, False]
+
+
+def test_training_data_uk_change_without_northern_ireland_start(training_cube):
+    # Northern Ireland data starts in 2001, the UK change for 2001 is the change of the rest of the UK
+    uk = select_statistics(batch_statistics(training_cube, levels=['UK']), 'UK').set_index('year')
+    rest = training_cube.country_codes != training_cube.country_position('Northern Ireland')
+    change = training_cube.change(2000, 2001)[rest]
+    assert uk.loc[2001, 'change'] == pytest.approx(np.nansum(change))
+    assert uk.loc[2001, 'change'] < 500000
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from egm722.timeseries import cagr, difference_tensor, trend_summary
+
+
+def test_difference_tensor(small_cube):
+    tensor = difference_tensor(small_cube)
+    assert tensor.shape == (5, 4, 4)
+    np.testing.assert_array_equal(tensor[:, 0, 3], small_cube.change(2000, 2003))
+    np.testing.assert_array_equal(tensor[:, 3, 0], -tensor[:, 0, 3])
+    assert (np.nan_to_num(tensor[:, np.arange(4), np.arange(4)]) == 0).all()
+    np.testing.assert_array_equal(difference_tensor(small_cube, rows=[2])[0], tensor[2])
+
+
+def test_cagr(small_cube):
+    rates = cagr(small_cube, 2000, 2003)
+    assert rates['A1'] == pytest.approx(0.1)  # 100 -> 133.1 is 10% a year
+    assert rates['X1'] == 0
+    assert np.isnan(rates['B1'])  # no data in the start year
+    assert rates.name == 'CAGR 2000-2003'
+
+
+@pytest.mark.parametrize('start, end', [(2002, 2002), (2003, 2000)])
+def test_cagr_needs_a_forward_window(small_cube, start, end):
+    with pytest.raises(ValueError):
+        cagr(small_cube, start, end)
+
+
+def test_trend_summary(small_cube):
+    summary = trend_summary(small_cube, 2000, 2003)
+    assert summary['CTYUA20CD'].tolist()[:2] == ['A3', 'A1']  # in descending order of CAGR
+    by_id = summary.set_index('CTYUA20CD')
+    assert by_id.loc['A1', 'CAGR'] == pytest.approx(0.1)
+    assert by_id.loc['A3', 'Trend per year'] == pytest.approx(10)
+    assert by_id.loc['A1', 'Trend growth'] == pytest.approx(0.1)
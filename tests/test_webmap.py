@@ -0,0 +1,72 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+gpd = pytest.importorskip('geopandas')
+from shapely.geometry import MultiPolygon, Polygon, box  # noqa: E402
+
+from egm722.cube import COUNTIES_UA_SHP  # noqa: E402
+from egm722.webmap import export_webmap, topology  # noqa: E402
+
+
+def _decode(topo, geometry):
+    """ Polygon or MultiPolygon of a TopoJSON geometry, in the topology's lon/lat. """
+    scale, translate = np.asarray(topo['transform']['scale']), np.asarray(topo['transform']['translate'])
+    arcs = [np.cumsum(arc, axis=0) * scale + translate for arc in topo['arcs']]
+
+    def ring(indices):
+        parts = [arcs[i] if i >= 0 else arcs[~i][::-1] for i in indices]
+        return np.concatenate([parts[0]] + [part[1:] for part in parts[1:]])
+
+    polygons = [geometry['arcs']] if geometry['type'] == 'Polygon' else geometry['arcs']
+    return MultiPolygon([Polygon(ring(rings[0]), [ring(hole) for hole in rings[1:]]) for rings in polygons])
+
+
+@pytest.fixture
+def layer():
+    # two neighbouring squares sharing a border, and a square with a hole further away (OSGB metres)
+    return gpd.GeoSeries([box(300000, 400000, 301000, 401000), box(301000, 400000, 302000, 401000),
+                          Polygon([(310000, 400000), (312000, 400000), (312000, 402000), (310000, 402000)],
+                                  [[(310500, 400500), (310500, 401500), (311500, 401500), (311500, 400500)]])],
+                         crs='EPSG:27700')
+
+
+def test_topology_round_trip(layer):
+    topo = json.loads(json.dumps(topology(layer, ['A', 'B', 'C'], [{'name': n} for n in 'abc'])))
+    geometries = topo['objects']['counties_UA']['geometries']
+    assert [geometry['id'] for geometry in geometries] == ['A', 'B', 'C']
+    assert geometries[0]['properties'] == {'name': 'a'}
+    assert len(topo['arcs']) == 5  # the shared border once, the rest of each square, the outline and the hole
+
+    original = layer.to_crs(epsg=4326)
+    for geometry, expected in zip(geometries, original):
+        decoded = _decode(topo, geometry)
+        assert decoded.is_valid
+        assert decoded.symmetric_difference(expected).area < 1e-3 * expected.area
+
+
+def test_shared_border_simplified_once():
+    wiggly = gpd.GeoSeries([Polygon([(0, 0), (500, 0), (1000, 0), (1000, 300), (1000, 600), (1000, 1000), (0, 1000)]),
+                            Polygon([(1000, 0), (2000, 0), (2000, 1000), (1000, 1000), (1000, 600), (1000, 300)])],
+                           crs='EPSG:27700').translate(300000, 400000)
+    topo = topology(wiggly, ['A', 'B'], tolerance=10)
+    a, b = (_decode(topo, geometry) for geometry in topo['objects']['counties_UA']['geometries'])
+    assert a.intersection(b).area == pytest.approx(0, abs=1e-12)  # the neighbours still meet without overlapping
+    assert max(len(arc) for arc in topo['arcs']) <= 4
+
+
+def test_export_without_change_pairs(training_cube, tmp_path):
+    if not os.path.exists(COUNTIES_UA_SHP):
+        pytest.skip('training data not found')
+    output_dir = str(tmp_path / 'web')
+    written = export_webmap(training_cube, COUNTIES_UA_SHP, output_dir, change_pairs=[], tolerance=5000)
+    assert written['change'] == []
+    with open(written['index']) as f:
+        index = json.load(f)
+    assert index['change'] == {}
+    assert len(index['population']) == len(training_cube.years)
+    with open(os.path.join(output_dir, 'population', '2006.json')) as f:
+        population = json.load(f)
+    assert sum(value for value in population if value is not None) == training_cube.year_statistics(2006)['sum']